@@ -1,7 +1,9 @@
 """Intégration Délestage Électrique."""
 import logging
+import time
 from homeassistant.core import HomeAssistant
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.helpers.start import async_at_started
 from .const import DOMAIN
 from .coordinator import DelestageCoordinator
 
@@ -12,16 +14,25 @@ PLATFORMS = ["sensor"]
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Initialisation de l'intégration."""
+    start = time.monotonic()
     coordinator = DelestageCoordinator(hass, entry)
     await coordinator.async_setup()
-    await coordinator.async_config_entry_first_refresh()
+    # Données initiales depuis le cache : aucune décision ni appel de service
+    coordinator.async_prime()
 
     hass.data.setdefault(DOMAIN, {})[entry.entry_id] = coordinator
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
+    # Première décision une fois Home Assistant démarré
+    entry.async_on_unload(
+        async_at_started(hass, coordinator.async_start_decisions)
+    )
     entry.async_on_unload(
         entry.add_update_listener(async_reload_entry)
     )
+
+    coordinator.startup_time = round((time.monotonic() - start) * 1000, 1)
+    _LOGGER.debug("Délestage démarré en %.1f ms", coordinator.startup_time)
     return True
 
 
@@ -34,5 +45,6 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Décharge l'intégration."""
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
     if unload_ok:
-        hass.data[DOMAIN].pop(entry.entry_id)
+        coordinator = hass.data[DOMAIN].pop(entry.entry_id)
+        await coordinator.async_unload()
     return unload_ok
@@ -0,0 +1,266 @@
+"""Banc d'essai du chemin chaud du coordinateur.
+
+Mesure, pour 10/100/1000 équipements et trois profils de puissance
+(calme, oscillant, surcharge), le trajet complet d'un échantillon :
+``_power_changed`` → acteur → ``_delestage_logic`` → ``_build_data`` →
+écriture des entités. Home Assistant tourne en processus (non démarré),
+avec des services turn_on/turn_off factices.
+
+Usage (depuis le dossier parent de l'intégration)::
+
+    python -m delestage.bench
+    python -m delestage.bench --save delestage/bench_baseline.json
+
+La référence versionnée est ``bench_baseline.json``, à côté de ce fichier :
+chaque exécution s'y compare par défaut (``--baseline`` pour une autre,
+``--baseline ''`` pour aucune) et le code de sortie vaut 1 si un cas
+régresse au-delà de ``--tolerance`` (débit ou p99). Les mesures dépendent
+de la machine : la référence se régénère avec ``--save`` sur la machine qui
+compare, aux tailles et profils par défaut, après un changement voulu du
+chemin chaud.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+from homeassistant.const import EVENT_STATE_CHANGED
+from homeassistant.core import HomeAssistant
+from .const import *
+from .coordinator import DelestageCoordinator
+from .sensor import build_entities
+
+POWER_SENSOR = "sensor.bench_power"
+BENCH_MAX_POWER = 10000.0
+# Charge totale répartie sur les équipements, quel que soit leur nombre
+BENCH_TOTAL_LOAD = 20000.0
+SIZES = (10, 100, 1000)
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "bench_baseline.json")
+
+
+def _quiet(i: int) -> float:
+    return 4000.0 + (i % 7) * 10
+
+
+def _oscillating(i: int) -> float:
+    return (12000.0 if (i // 5) % 2 else 6000.0) + (i % 5) * 10
+
+
+def _overload(i: int) -> float:
+    return 14000.0 + (i % 5) * 20
+
+
+PATTERNS = {
+    "quiet":       _quiet,
+    "oscillating": _oscillating,
+    "overload":    _overload,
+}
+
+
+class _Bench:
+    """Un coordinateur, ses entités et un compteur simulé."""
+
+    def __init__(self, hass: HomeAssistant, size: int):
+        self.hass = hass
+        self.load = BENCH_TOTAL_LOAD / size
+        self.off = set()
+        self.base = 0.0
+        self.writes = 0
+        equipments = [
+            {
+                CONF_DEVICE_NAME:       f"Charge {i}",
+                CONF_DEVICE_ENTITY:     f"switch.bench_{i}",
+                CONF_DEVICE_PRIORITY:   i % 10 + 1,
+                CONF_DEVICE_POWER_MODE: "fixed",
+                CONF_DEVICE_FIXED_PWR:  self.load,
+                # Pas de fenêtre d'appel de courant : on mesure le chemin chaud
+                CONF_DEVICE_INRUSH:     0,
+            }
+            for i in range(size)
+        ]
+        self.entry = SimpleNamespace(
+            entry_id=f"bench_{size}",
+            data={
+                CONF_POWER_SENSOR:   POWER_SENSOR,
+                CONF_MAX_POWER:      BENCH_MAX_POWER,
+                CONF_RECOVERY_DELAY: 0,
+                CONF_REARM_MARGIN:   0,
+            },
+            options={CONF_EQUIPMENTS: equipments, CONF_MIN_INTERVAL: 0},
+        )
+        for eq in equipments:
+            hass.states.async_set(eq[CONF_DEVICE_ENTITY], "on")
+        hass.states.async_set(POWER_SENSOR, "0")
+
+    async def async_setup(self):
+        hass = self.hass
+        for service in ("turn_on", "turn_off"):
+            hass.services.async_register("switch", service, self._service)
+        hass.bus.async_listen(EVENT_STATE_CHANGED, self._count_write)
+
+        self.coordinator = DelestageCoordinator(hass, self.entry)
+        await self.coordinator.async_setup()
+        self.coordinator.async_prime()
+        for i, entity in enumerate(build_entities(self.coordinator, self.entry)):
+            entity.hass = hass
+            entity.entity_id = f"sensor.delestage_bench_{i}"
+            await entity.async_added_to_hass()
+
+    async def _service(self, call):
+        entity_id = call.data["entity_id"]
+        if call.service == "turn_off":
+            self.off.add(entity_id)
+            self.hass.states.async_set(entity_id, "off")
+        else:
+            self.off.discard(entity_id)
+            self.hass.states.async_set(entity_id, "on")
+
+    def _count_write(self, event):
+        if event.data["entity_id"].startswith("sensor.delestage_bench_"):
+            self.writes += 1
+
+    def _meter(self, force: bool = False):
+        power = self.base - self.load * len(self.off)
+        self.hass.states.async_set(POWER_SENSOR, str(power), force_update=force)
+
+    async def sample(self, base: float):
+        """Publie un échantillon et attend la fin de son traitement."""
+        self.base = base
+        self._meter()
+        c = self.coordinator
+        while True:
+            await asyncio.sleep(0)
+            if c._sample_waiters:
+                # La décision attend l'effet de son action : le compteur répond
+                self._meter(force=True)
+                continue
+            if c._deciding or not c._queue.empty():
+                continue
+            if c._unsub_recovery is not None and c._recovery_elapsed():
+                continue
+            return
+
+
+async def run_case(size: int, pattern: str, events: int, warmup: int) -> dict:
+    """Exécute un cas et retourne débit, percentiles et allocations."""
+    profile = PATTERNS[pattern]
+    result = {}
+    for traced in (False, True):
+        with tempfile.TemporaryDirectory() as config_dir:
+            hass = HomeAssistant(config_dir)
+            bench = _Bench(hass, size)
+            await bench.async_setup()
+            for i in range(warmup):
+                await bench.sample(profile(i))
+            writes_before = bench.writes
+
+            if traced:
+                tracemalloc.start()
+                start_mem, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+                for i in range(warmup, warmup + events):
+                    await bench.sample(profile(i))
+                end_mem, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                result["alloc_peak_kib"] = round((peak - start_mem) / 1024, 1)
+                result["alloc_net_kib"] = round((end_mem - start_mem) / 1024, 1)
+            else:
+                latencies = []
+                started = time.perf_counter()
+                for i in range(warmup, warmup + events):
+                    t0 = time.perf_counter_ns()
+                    await bench.sample(profile(i))
+                    latencies.append(time.perf_counter_ns() - t0)
+                elapsed = time.perf_counter() - started
+                latencies.sort()
+                result.update({
+                    "events_per_s":     round(events / elapsed, 1),
+                    "p50_us":           _percentile(latencies, 50),
+                    "p90_us":           _percentile(latencies, 90),
+                    "p99_us":           _percentile(latencies, 99),
+                    "max_us":           round(latencies[-1] / 1000, 1),
+                    "writes_per_event": round((bench.writes - writes_before) / events, 2),
+                })
+            await bench.coordinator.async_unload()
+            await hass.async_stop(force=True)
+    return result
+
+
+def _percentile(ordered: list, pct: int) -> float:
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return round(ordered[index] / 1000, 1)
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Cas dont le débit baisse ou le p99 monte au-delà de la tolérance."""
+    regressions = []
+    for case, current in results.items():
+        ref = baseline.get(case)
+        if not ref:
+            continue
+        if current["events_per_s"] < ref["events_per_s"] * (1 - tolerance):
+            regressions.append(
+                f"{case}: {current['events_per_s']} évén./s < {ref['events_per_s']}"
+            )
+        if current["p99_us"] > ref["p99_us"] * (1 + tolerance):
+            regressions.append(f"{case}: p99 {current['p99_us']} µs > {ref['p99_us']}")
+    return regressions
+
+
+async def _run(sizes, patterns, events: int, warmup: int) -> dict:
+    results = {}
+    for size in sizes:
+        for pattern in patterns:
+            case = f"{size}/{pattern}"
+            results[case] = await run_case(size, pattern, events, warmup)
+            r = results[case]
+            print(
+                f"{case:<18} {r['events_per_s']:>10.1f} évén./s  "
+                f"p50 {r['p50_us']:>9.1f} µs  p99 {r['p99_us']:>9.1f} µs  "
+                f"écritures {r['writes_per_event']:>6.2f}  "
+                f"alloc pic {r['alloc_peak_kib']:>8.1f} KiB",
+                flush=True,
+            )
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Banc d'essai du coordinateur")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--patterns", nargs="+", choices=list(PATTERNS), default=list(PATTERNS))
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument(
+        "--baseline",
+        default=BASELINE_FILE if os.path.exists(BASELINE_FILE) else None,
+        help="JSON de référence à comparer (défaut : bench_baseline.json)",
+    )
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--save", help="écrit les résultats comme nouvelle référence")
+    args = parser.parse_args(argv)
+
+    # Entités sans plateforme : Home Assistant le signale à chaque ajout
+    logging.basicConfig(level=logging.ERROR)
+
+    results = asyncio.run(_run(args.sizes, args.patterns, args.events, args.warmup))
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            regressions = compare(results, json.load(fh), args.tolerance)
+        for line in regressions:
+            print(f"RÉGRESSION {line}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
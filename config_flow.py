@@ -11,6 +11,7 @@ from homeassistant.helpers.selector import (
     SelectSelectorConfig,
     SelectSelectorMode,
     TextSelector,
+    TextSelectorConfig,
 )
 from .const import (
     DOMAIN,
@@ -18,6 +19,37 @@ from .const import (
     CONF_MAX_POWER,
     CONF_RECOVERY_DELAY,
     CONF_REARM_MARGIN,
+    CONF_MIN_INTERVAL,
+    CONF_PARALLEL_SHED,
+    CONF_SHED_TIMEOUT,
+    CONF_SHED_CONCURRENCY,
+    CONF_SETTLE_TIMEOUT,
+    CONF_STALE_TIMEOUT,
+    DEFAULT_MIN_INTERVAL,
+    DEFAULT_SHED_TIMEOUT,
+    DEFAULT_SHED_CONCURRENCY,
+    DEFAULT_SETTLE_TIMEOUT,
+    DEFAULT_STALE_TIMEOUT,
+    CONF_OVERLOAD_BUDGET,
+    CONF_HARD_MAX_POWER,
+    CONF_PREDICT_HORIZON,
+    DEFAULT_OVERLOAD_BUDGET,
+    DEFAULT_HARD_MAX_POWER,
+    DEFAULT_PREDICT_HORIZON,
+    CONF_CHARGER_ENTITY,
+    CONF_CHARGER_SENSOR,
+    CONF_CHARGER_UNIT_POWER,
+    CONF_CHARGER_MIN_CURRENT,
+    CONF_CHARGER_MAX_CURRENT,
+    CONF_CHARGER_HYSTERESIS,
+    CONF_CHARGER_INTERVAL,
+    DEFAULT_CHARGER_UNIT_POWER,
+    DEFAULT_CHARGER_MIN_CURRENT,
+    DEFAULT_CHARGER_MAX_CURRENT,
+    DEFAULT_CHARGER_HYSTERESIS,
+    DEFAULT_CHARGER_INTERVAL,
+    CONF_SCHEDULE,
+    CONF_TARIFF_ENTITY,
     CONF_EQUIPMENTS,
     CONF_DEVICE_NAME,
     CONF_DEVICE_ENTITY,
@@ -25,7 +57,20 @@ from .const import (
     CONF_DEVICE_POWER_MODE,
     CONF_DEVICE_FIXED_PWR,
     CONF_DEVICE_PWR_SENSOR,
+    CONF_DEVICE_INRUSH,
+    DEFAULT_INRUSH_DELAY,
+    CONF_DEVICE_CONTROL,
+    CONF_DEVICE_MIN_LEVEL,
+    CONF_DEVICE_MAX_LEVEL,
+    CONF_DEVICE_UNIT_POWER,
+    CONF_DEVICE_STEP,
+    CONTROL_TOGGLE,
+    CONTROL_NUMBER,
+    CONTROL_CLIMATE,
+    CONTROL_BRIGHTNESS,
+    CONTROL_DOMAINS,
 )
+from .schedule import parse_schedule
 
 
 class DelestageConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
@@ -139,8 +184,12 @@ class DelestageOptionsFlow(config_entries.OptionsFlow):
 
         if user_input is not None:
             entity = user_input.get(CONF_DEVICE_ENTITY, "")
+            control = user_input.get(CONF_DEVICE_CONTROL, CONTROL_TOGGLE)
+            domain = entity.split(".", 1)[0]
             if not entity:
                 errors[CONF_DEVICE_ENTITY] = "entity_not_found"
+            elif control != CONTROL_TOGGLE and domain not in CONTROL_DOMAINS.get(control, ()):
+                errors[CONF_DEVICE_CONTROL] = "control_unsupported"
             else:
                 self._equipments.append({
                     CONF_DEVICE_NAME:       user_input.get(CONF_DEVICE_NAME, ""),
@@ -149,7 +198,15 @@ class DelestageOptionsFlow(config_entries.OptionsFlow):
                     CONF_DEVICE_POWER_MODE: user_input.get(CONF_DEVICE_POWER_MODE, "fixed"),
                     CONF_DEVICE_FIXED_PWR:  float(user_input.get(CONF_DEVICE_FIXED_PWR, 0)),
                     CONF_DEVICE_PWR_SENSOR: user_input.get(CONF_DEVICE_PWR_SENSOR, ""),
+                    CONF_DEVICE_INRUSH:     float(user_input.get(
+                        CONF_DEVICE_INRUSH, DEFAULT_INRUSH_DELAY)),
+                    CONF_DEVICE_CONTROL:    control,
                 })
+                # Plage de modulation : seulement si renseignée (défauts par pilotage sinon)
+                for key in (CONF_DEVICE_MIN_LEVEL, CONF_DEVICE_MAX_LEVEL,
+                            CONF_DEVICE_UNIT_POWER, CONF_DEVICE_STEP):
+                    if user_input.get(key) is not None:
+                        self._equipments[-1][key] = float(user_input[key])
                 return await self.async_step_init()
 
         return self.async_show_form(
@@ -159,7 +216,7 @@ class DelestageOptionsFlow(config_entries.OptionsFlow):
                 vol.Required(CONF_DEVICE_NAME): TextSelector(),
                 vol.Required(CONF_DEVICE_ENTITY): EntitySelector(
                     EntitySelectorConfig(
-                        domain=["switch", "input_boolean", "light", "climate"]
+                        domain=["switch", "input_boolean", "light", "climate", "number"]
                     )
                 ),
                 vol.Required(CONF_DEVICE_PRIORITY, default=1): NumberSelector(
@@ -187,6 +244,40 @@ class DelestageOptionsFlow(config_entries.OptionsFlow):
                 vol.Optional(CONF_DEVICE_PWR_SENSOR): EntitySelector(
                     EntitySelectorConfig(domain=["sensor"])
                 ),
+                vol.Optional(CONF_DEVICE_INRUSH, default=DEFAULT_INRUSH_DELAY): NumberSelector(
+                    NumberSelectorConfig(
+                        min=0, max=300, step=1,
+                        mode=NumberSelectorMode.BOX,
+                        unit_of_measurement="s",
+                    )
+                ),
+                vol.Required(CONF_DEVICE_CONTROL, default=CONTROL_TOGGLE): SelectSelector(
+                    SelectSelectorConfig(
+                        options=[
+                            {"value": CONTROL_TOGGLE,     "label": "Tout ou rien"},
+                            {"value": CONTROL_NUMBER,     "label": "Consigne numérique (ex. ampères)"},
+                            {"value": CONTROL_CLIMATE,    "label": "Abaissement de consigne (climat)"},
+                            {"value": CONTROL_BRIGHTNESS, "label": "Luminosité"},
+                        ],
+                        mode=SelectSelectorMode.LIST,
+                    )
+                ),
+                vol.Optional(CONF_DEVICE_MIN_LEVEL): NumberSelector(
+                    NumberSelectorConfig(min=0, max=1000, step=0.5, mode=NumberSelectorMode.BOX)
+                ),
+                vol.Optional(CONF_DEVICE_MAX_LEVEL): NumberSelector(
+                    NumberSelectorConfig(min=0, max=1000, step=0.5, mode=NumberSelectorMode.BOX)
+                ),
+                vol.Optional(CONF_DEVICE_UNIT_POWER): NumberSelector(
+                    NumberSelectorConfig(
+                        min=0, max=20000, step=1,
+                        mode=NumberSelectorMode.BOX,
+                        unit_of_measurement="W",
+                    )
+                ),
+                vol.Optional(CONF_DEVICE_STEP): NumberSelector(
+                    NumberSelectorConfig(min=0.1, max=100, step=0.1, mode=NumberSelectorMode.BOX)
+                ),
             }),
         )
 
@@ -239,12 +330,49 @@ class DelestageOptionsFlow(config_entries.OptionsFlow):
 
 
         if user_input is not None:
+            try:
+                parse_schedule(user_input.get(CONF_SCHEDULE, ""))
+            except ValueError:
+                errors[CONF_SCHEDULE] = "invalid_schedule"
+
+        if user_input is not None and not errors:
             updated = {
                 **self._entry.options,
                 CONF_POWER_SENSOR:   user_input.get(CONF_POWER_SENSOR),
                 CONF_MAX_POWER:      float(user_input.get(CONF_MAX_POWER, 6000)),
                 CONF_RECOVERY_DELAY: float(user_input.get(CONF_RECOVERY_DELAY, 300)),
                 CONF_REARM_MARGIN:   float(user_input.get(CONF_REARM_MARGIN, 0)),
+                CONF_MIN_INTERVAL:   float(user_input.get(
+                    CONF_MIN_INTERVAL, DEFAULT_MIN_INTERVAL)),
+                CONF_PARALLEL_SHED:  user_input.get(CONF_PARALLEL_SHED, False),
+                CONF_SHED_TIMEOUT:   float(user_input.get(
+                    CONF_SHED_TIMEOUT, DEFAULT_SHED_TIMEOUT)),
+                CONF_SHED_CONCURRENCY: int(user_input.get(
+                    CONF_SHED_CONCURRENCY, DEFAULT_SHED_CONCURRENCY)),
+                CONF_SETTLE_TIMEOUT: float(user_input.get(
+                    CONF_SETTLE_TIMEOUT, DEFAULT_SETTLE_TIMEOUT)),
+                CONF_STALE_TIMEOUT:  float(user_input.get(
+                    CONF_STALE_TIMEOUT, DEFAULT_STALE_TIMEOUT)),
+                CONF_OVERLOAD_BUDGET: float(user_input.get(
+                    CONF_OVERLOAD_BUDGET, DEFAULT_OVERLOAD_BUDGET)),
+                CONF_HARD_MAX_POWER: float(user_input.get(
+                    CONF_HARD_MAX_POWER, DEFAULT_HARD_MAX_POWER)),
+                CONF_PREDICT_HORIZON: float(user_input.get(
+                    CONF_PREDICT_HORIZON, DEFAULT_PREDICT_HORIZON)),
+                CONF_CHARGER_ENTITY: user_input.get(CONF_CHARGER_ENTITY, ""),
+                CONF_CHARGER_SENSOR: user_input.get(CONF_CHARGER_SENSOR, ""),
+                CONF_CHARGER_UNIT_POWER: float(user_input.get(
+                    CONF_CHARGER_UNIT_POWER, DEFAULT_CHARGER_UNIT_POWER)),
+                CONF_CHARGER_MIN_CURRENT: float(user_input.get(
+                    CONF_CHARGER_MIN_CURRENT, DEFAULT_CHARGER_MIN_CURRENT)),
+                CONF_CHARGER_MAX_CURRENT: float(user_input.get(
+                    CONF_CHARGER_MAX_CURRENT, DEFAULT_CHARGER_MAX_CURRENT)),
+                CONF_CHARGER_HYSTERESIS: float(user_input.get(
+                    CONF_CHARGER_HYSTERESIS, DEFAULT_CHARGER_HYSTERESIS)),
+                CONF_CHARGER_INTERVAL: float(user_input.get(
+                    CONF_CHARGER_INTERVAL, DEFAULT_CHARGER_INTERVAL)),
+                CONF_SCHEDULE:       user_input.get(CONF_SCHEDULE, ""),
+                CONF_TARIFF_ENTITY:  user_input.get(CONF_TARIFF_ENTITY, ""),
                 "enable_shedding":  user_input.get("enable_shedding", True),
                 CONF_EQUIPMENTS:     self._equipments,
             }
@@ -284,6 +412,137 @@ class DelestageOptionsFlow(config_entries.OptionsFlow):
                     mode=NumberSelectorMode.BOX,
                     unit_of_measurement="W",
                 )),
+                vol.Optional(
+                    CONF_MIN_INTERVAL,
+                    default=current.get(CONF_MIN_INTERVAL, DEFAULT_MIN_INTERVAL)
+                ): NumberSelector(NumberSelectorConfig(
+                    min=0, max=60, step=0.5,
+                    mode=NumberSelectorMode.BOX,
+                    unit_of_measurement="s",
+                )),
+                vol.Optional(
+                    CONF_PARALLEL_SHED,
+                    default=current.get(CONF_PARALLEL_SHED, False)
+                ): bool,
+                vol.Optional(
+                    CONF_SHED_TIMEOUT,
+                    default=current.get(CONF_SHED_TIMEOUT, DEFAULT_SHED_TIMEOUT)
+                ): NumberSelector(NumberSelectorConfig(
+                    min=1, max=120, step=1,
+                    mode=NumberSelectorMode.BOX,
+                    unit_of_measurement="s",
+                )),
+                vol.Optional(
+                    CONF_SHED_CONCURRENCY,
+                    default=current.get(CONF_SHED_CONCURRENCY, DEFAULT_SHED_CONCURRENCY)
+                ): NumberSelector(NumberSelectorConfig(
+                    min=1, max=32, step=1,
+                    mode=NumberSelectorMode.BOX,
+                )),
+                vol.Optional(
+                    CONF_SETTLE_TIMEOUT,
+                    default=current.get(CONF_SETTLE_TIMEOUT, DEFAULT_SETTLE_TIMEOUT)
+                ): NumberSelector(NumberSelectorConfig(
+                    min=1, max=60, step=1,
+                    mode=NumberSelectorMode.BOX,
+                    unit_of_measurement="s",
+                )),
+                vol.Optional(
+                    CONF_STALE_TIMEOUT,
+                    default=current.get(CONF_STALE_TIMEOUT, DEFAULT_STALE_TIMEOUT)
+                ): NumberSelector(NumberSelectorConfig(
+                    min=10, max=600, step=10,
+                    mode=NumberSelectorMode.BOX,
+                    unit_of_measurement="s",
+                )),
+                vol.Optional(
+                    CONF_OVERLOAD_BUDGET,
+                    default=current.get(CONF_OVERLOAD_BUDGET, DEFAULT_OVERLOAD_BUDGET)
+                ): NumberSelector(NumberSelectorConfig(
+                    min=0, max=1000000, step=1000,
+                    mode=NumberSelectorMode.BOX,
+                    unit_of_measurement="J",
+                )),
+                vol.Optional(
+                    CONF_HARD_MAX_POWER,
+                    default=current.get(CONF_HARD_MAX_POWER, DEFAULT_HARD_MAX_POWER)
+                ): NumberSelector(NumberSelectorConfig(
+                    min=0, max=100000, step=100,
+                    mode=NumberSelectorMode.BOX,
+                    unit_of_measurement="W",
+                )),
+                vol.Optional(
+                    CONF_PREDICT_HORIZON,
+                    default=current.get(CONF_PREDICT_HORIZON, DEFAULT_PREDICT_HORIZON)
+                ): NumberSelector(NumberSelectorConfig(
+                    min=0, max=300, step=1,
+                    mode=NumberSelectorMode.BOX,
+                    unit_of_measurement="s",
+                )),
+                # Seuils par plage horaire : « [tarif] HH:MM-HH:MM=W », une règle par ligne
+                vol.Optional(
+                    CONF_SCHEDULE,
+                    default=current.get(CONF_SCHEDULE, "")
+                ): TextSelector(TextSelectorConfig(multiline=True)),
+                vol.Optional(
+                    CONF_TARIFF_ENTITY,
+                    description={"suggested_value": current.get(CONF_TARIFF_ENTITY) or None}
+                ): EntitySelector(
+                    EntitySelectorConfig(domain=["sensor", "select", "input_select"])
+                ),
+                # Borne de recharge : entités facultatives, laissées vides si absentes
+                vol.Optional(
+                    CONF_CHARGER_ENTITY,
+                    description={"suggested_value": current.get(CONF_CHARGER_ENTITY) or None}
+                ): EntitySelector(
+                    EntitySelectorConfig(domain=["number", "input_number"])
+                ),
+                vol.Optional(
+                    CONF_CHARGER_SENSOR,
+                    description={"suggested_value": current.get(CONF_CHARGER_SENSOR) or None}
+                ): EntitySelector(
+                    EntitySelectorConfig(domain=["sensor"])
+                ),
+                vol.Optional(
+                    CONF_CHARGER_UNIT_POWER,
+                    default=current.get(CONF_CHARGER_UNIT_POWER, DEFAULT_CHARGER_UNIT_POWER)
+                ): NumberSelector(NumberSelectorConfig(
+                    min=100, max=1000, step=1,
+                    mode=NumberSelectorMode.BOX,
+                    unit_of_measurement="W/A",
+                )),
+                vol.Optional(
+                    CONF_CHARGER_MIN_CURRENT,
+                    default=current.get(CONF_CHARGER_MIN_CURRENT, DEFAULT_CHARGER_MIN_CURRENT)
+                ): NumberSelector(NumberSelectorConfig(
+                    min=0, max=80, step=1,
+                    mode=NumberSelectorMode.BOX,
+                    unit_of_measurement="A",
+                )),
+                vol.Optional(
+                    CONF_CHARGER_MAX_CURRENT,
+                    default=current.get(CONF_CHARGER_MAX_CURRENT, DEFAULT_CHARGER_MAX_CURRENT)
+                ): NumberSelector(NumberSelectorConfig(
+                    min=1, max=80, step=1,
+                    mode=NumberSelectorMode.BOX,
+                    unit_of_measurement="A",
+                )),
+                vol.Optional(
+                    CONF_CHARGER_HYSTERESIS,
+                    default=current.get(CONF_CHARGER_HYSTERESIS, DEFAULT_CHARGER_HYSTERESIS)
+                ): NumberSelector(NumberSelectorConfig(
+                    min=0, max=16, step=1,
+                    mode=NumberSelectorMode.BOX,
+                    unit_of_measurement="A",
+                )),
+                vol.Optional(
+                    CONF_CHARGER_INTERVAL,
+                    default=current.get(CONF_CHARGER_INTERVAL, DEFAULT_CHARGER_INTERVAL)
+                ): NumberSelector(NumberSelectorConfig(
+                    min=0, max=600, step=1,
+                    mode=NumberSelectorMode.BOX,
+                    unit_of_measurement="s",
+                )),
                 vol.Optional(
                     "enable_shedding",
                     default=enable_shedding
@@ -1,5 +1,7 @@
 """Constantes de l'intégration Délestage Électrique."""
 
+from datetime import timedelta
+
 DOMAIN = "delestage"
 
 # ── Configuration globale ──────────────────────────────────────────
@@ -7,6 +9,54 @@ CONF_POWER_SENSOR   = "power_sensor"
 CONF_MAX_POWER      = "max_power"
 CONF_RECOVERY_DELAY = "recovery_delay"
 CONF_REARM_MARGIN   = "rearm_margin"
+CONF_MIN_INTERVAL   = "min_interval"
+CONF_PARALLEL_SHED  = "parallel_shed"
+CONF_SHED_TIMEOUT   = "shed_timeout"
+CONF_SHED_CONCURRENCY = "shed_concurrency"
+CONF_SETTLE_TIMEOUT = "settle_timeout"
+CONF_STALE_TIMEOUT  = "stale_timeout"
+CONF_OVERLOAD_BUDGET = "overload_budget"
+CONF_HARD_MAX_POWER = "hard_max_power"
+CONF_PREDICT_HORIZON = "predict_horizon"
+# Boucle de budget d'une borne de recharge (limite de courant)
+CONF_CHARGER_ENTITY      = "charger_entity"
+CONF_CHARGER_SENSOR      = "charger_power_sensor"
+CONF_CHARGER_UNIT_POWER  = "charger_unit_power"
+CONF_CHARGER_MIN_CURRENT = "charger_min_current"
+CONF_CHARGER_MAX_CURRENT = "charger_max_current"
+CONF_CHARGER_HYSTERESIS  = "charger_hysteresis"
+CONF_CHARGER_INTERVAL    = "charger_interval"
+# Seuils par plage horaire, choisis selon l'état d'une entité tarif
+CONF_SCHEDULE       = "threshold_schedule"
+CONF_TARIFF_ENTITY  = "tariff_entity"
+
+DEFAULT_MIN_INTERVAL     = 1.0
+DEFAULT_SHED_TIMEOUT     = 10.0
+DEFAULT_SHED_CONCURRENCY = 4
+DEFAULT_SETTLE_TIMEOUT   = 5.0
+DEFAULT_STALE_TIMEOUT    = 60.0
+# Tolérance de surcharge type I²t : 0 = coupure dès le dépassement (historique)
+DEFAULT_OVERLOAD_BUDGET  = 0.0
+DEFAULT_HARD_MAX_POWER   = 0.0
+# Délestage prédictif : horizon de projection de la tendance, 0 = désactivé
+DEFAULT_PREDICT_HORIZON  = 0.0
+# Fenêtre glissante (échantillons) de l'estimation de pente
+PREDICT_WINDOW = 8
+# Borne : W par ampère (230 mono, 690 tri), plage et anti-oscillation
+DEFAULT_CHARGER_UNIT_POWER  = 230.0
+DEFAULT_CHARGER_MIN_CURRENT = 6.0
+DEFAULT_CHARGER_MAX_CURRENT = 32.0
+DEFAULT_CHARGER_HYSTERESIS  = 1.0   # A gardés sous le budget à chaque hausse
+DEFAULT_CHARGER_INTERVAL    = 10.0  # s entre deux hausses de limite
+
+# File de l'acteur de décision : seul le dernier échantillon en attente compte
+DECISION_QUEUE_SIZE = 1
+
+# Journal des décisions : tampon circulaire exposé dans les diagnostics
+DECISION_LOG_SIZE = 256
+
+# Polling de secours quand le capteur principal ne pousse plus
+FAST_POLL_INTERVAL = timedelta(seconds=5)
 
 # ── Configuration des équipements ──────────────────────────────────
 CONF_EQUIPMENTS        = "equipments"
@@ -16,6 +66,32 @@ CONF_DEVICE_PRIORITY   = "priority"
 CONF_DEVICE_POWER_MODE = "power_mode"
 CONF_DEVICE_FIXED_PWR  = "fixed_power"
 CONF_DEVICE_PWR_SENSOR = "power_sensor_device"
+CONF_DEVICE_INRUSH     = "inrush_delay"
+CONF_DEVICE_CONTROL    = "control"
+CONF_DEVICE_MIN_LEVEL  = "min_level"
+CONF_DEVICE_MAX_LEVEL  = "max_level"
+CONF_DEVICE_UNIT_POWER = "unit_power"
+CONF_DEVICE_STEP       = "level_step"
+
+# Pilotage : tout ou rien, ou modulation (niveau réduit pour couvrir le dépassement)
+CONTROL_TOGGLE     = "toggle"
+CONTROL_NUMBER     = "number"          # consigne numérique (ex. ampères d'une borne)
+CONTROL_CLIMATE    = "climate_offset"  # abaissement de la consigne de température
+CONTROL_BRIGHTNESS = "brightness"      # luminosité en %
+CONTROLS_MODULATING = (CONTROL_NUMBER, CONTROL_CLIMATE, CONTROL_BRIGHTNESS)
+# Domaines qui exposent le service de chaque pilotage modulé
+CONTROL_DOMAINS = {
+    CONTROL_NUMBER:     ("number",),
+    CONTROL_CLIMATE:    ("climate",),
+    CONTROL_BRIGHTNESS: ("light",),
+}
+
+# Fenêtre d'appel de courant après un rallumage, avant le suivant (s)
+DEFAULT_INRUSH_DELAY = 5.0
+
+# ── Persistance ────────────────────────────────────────────────────
+STORAGE_VERSION    = 1
+STORAGE_SAVE_DELAY = 5
 
 # ── États internes ─────────────────────────────────────────────────
 STATE_IDLE       = "idle"
@@ -29,3 +105,4 @@ ATTR_DEVICES_SHED       = "devices_shed"
 ATTR_LAST_SHED_TIME     = "last_shed_time"
 ATTR_LAST_RECOVERY_TIME = "last_recovery_time"
 ATTR_RECOVERY_REMAINING = "recovery_remaining_s"
+ATTR_ALL_DEVICES        = "all_devices"
@@ -1,15 +1,59 @@
 """Coordinateur de délestage électrique."""
+import asyncio
 import logging
+import time
 from datetime import timedelta, datetime
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
-from homeassistant.helpers.event import async_track_state_change_event
+from homeassistant.util import dt as dt_util
+from homeassistant.helpers.event import (
+    async_call_later,
+    async_track_state_change_event,
+)
 from .const import *
+from .engine import Backend, DelestageEngine
+from .equipment import Equipment
 
 _LOGGER = logging.getLogger(__name__)
 
 
-class DelestageCoordinator(DataUpdateCoordinator):
+class HassBackend(Backend):
+    """Horloge, minuteries et services de Home Assistant pour le moteur."""
+
+    def __init__(self, hass: HomeAssistant):
+        self.hass = hass
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def now(self) -> datetime:
+        return dt_util.now()
+
+    def utcnow(self) -> datetime:
+        return dt_util.utcnow()
+
+    def call_later(self, delay: float, action):
+        @callback
+        def _fire(_now=None):
+            action()
+
+        return async_call_later(self.hass, delay, _fire)
+
+    def create_future(self):
+        return self.hass.loop.create_future()
+
+    async def wait_for(self, aw, timeout: float):
+        return await asyncio.wait_for(aw, timeout=timeout)
+
+    async def call_service(self, domain: str, service: str, entity_id: str,
+                           data: dict | None = None):
+        await self.hass.services.async_call(
+            domain, service, {"entity_id": entity_id, **(data or {})}, blocking=True
+        )
+
+
+class DelestageCoordinator(DelestageEngine, DataUpdateCoordinator):
     """Logique centrale de délestage."""
 
     def __init__(self, hass: HomeAssistant, entry):
@@ -17,18 +61,34 @@ class DelestageCoordinator(DataUpdateCoordinator):
             hass,
             _LOGGER,
             name="Delestage Coordinator",
-            update_interval=timedelta(seconds=5),
+            update_interval=FAST_POLL_INTERVAL,
+            always_update=False,
         )
         self.entry = entry
-        self.state = STATE_IDLE
-        self.devices_shed = []
-        self.last_shed_time = None
-        self.last_recovery_time = None
-        self._recovery_start = None
+        self._init_engine(HassBackend(hass))
         self._unsub_tracker = None
+        self._unsub_devices = None
+        # Persistance de l'état de délestage (écrite sur transition uniquement)
+        self._store = Store(hass, STORAGE_VERSION, f"{DOMAIN}.{entry.entry_id}")
+        self._saved_signature = None
+        self._save_pending = False
+        # Ingestion : coalescence des rafales (dernière valeur gagnante)
+        self._last_processed = None
+        self._pending_power = None
+        self._unsub_flush = None
+        self.samples_received = 0
+        self.samples_coalesced = 0
+        self.startup_time = None
+        # Polling adaptatif : ralenti tant que le push est vivant
+        self._last_push = None
+        self.sensor_stale = False
+        # Acteur de décision : file bornée, l'échantillon le plus récent gagne
+        self._queue = asyncio.Queue(maxsize=DECISION_QUEUE_SIZE)
+        self._worker = None
+        self.samples_dropped = 0
+        self.max_queue_depth = 0
+        self.decisions = 0
         self._reload_config()
-        # Variable pour activer/désactiver le délestage (prise depuis les options)
-        self.enable_shedding = self.entry.options.get("enable_shedding", True)
 
     # ──────────────────────────────────────────────────────────────
     # Configuration
@@ -37,15 +97,14 @@ class DelestageCoordinator(DataUpdateCoordinator):
     def _reload_config(self):
         """Recharge la config depuis data + options."""
         cfg = {**self.entry.data, **self.entry.options}
+        # Seuils, table d'équipements et cache : côté moteur
+        self._configure(cfg)
         self.power_sensor   = cfg.get(CONF_POWER_SENSOR, "")
-        self.max_power      = float(cfg.get(CONF_MAX_POWER, 6000))
-        self.recovery_delay = float(cfg.get(CONF_RECOVERY_DELAY, 300))
-        self.rearm_margin   = float(cfg.get(CONF_REARM_MARGIN, 0))
-        self.equipments     = sorted(
-            cfg.get(CONF_EQUIPMENTS, []),
-            key=lambda e: int(float(e.get(CONF_DEVICE_PRIORITY, 99)))
-        )
-        self.enable_shedding = cfg.get("enable_shedding", True)
+        self.min_interval   = float(cfg.get(CONF_MIN_INTERVAL, DEFAULT_MIN_INTERVAL))
+        self.stale_timeout  = float(cfg.get(CONF_STALE_TIMEOUT, DEFAULT_STALE_TIMEOUT))
+        # Snapshot persistant : une vue par équipement, recréée si marquée sale
+        self._device_views = [None] * len(self.table)
+        self._all_devices = []
         _LOGGER.debug(
             "Config rechargée — capteur: %s | max: %.0f W | équipements: %d",
             self.power_sensor, self.max_power, len(self.equipments)
@@ -56,7 +115,16 @@ class DelestageCoordinator(DataUpdateCoordinator):
     # ──────────────────────────────────────────────────────────────
 
     async def async_setup(self):
-        """Abonnement temps réel au capteur de puissance."""
+        """Abonnement temps réel au capteur de puissance et aux équipements."""
+        await self._async_restore_state()
+        # Le silence du capteur se mesure depuis l'abonnement, pas depuis toujours
+        self._last_push = time.monotonic()
+
+        if self._worker is None:
+            self._worker = self.hass.async_create_background_task(
+                self._decision_worker(), f"{DOMAIN} decision worker"
+            )
+
         if self._unsub_tracker:
             self._unsub_tracker()
         if self.power_sensor:
@@ -65,70 +133,188 @@ class DelestageCoordinator(DataUpdateCoordinator):
             )
             _LOGGER.debug("Tracker abonné sur %s", self.power_sensor)
 
+        if self._unsub_devices:
+            self._unsub_devices()
+            self._unsub_devices = None
+        if self._watch:
+            for entity_id in self._watch:
+                self._update_cache(entity_id, self.hass.states.get(entity_id))
+            self._unsub_devices = async_track_state_change_event(
+                self.hass, list(self._watch), self._device_changed
+            )
+            _LOGGER.debug("Tracker abonné sur %d entité(s) d'équipement", len(self._watch))
+
     async def async_unload(self):
         """Désabonnement."""
+        # Rechargement (options) : la nouvelle instance relit le fichier tout de
+        # suite ; instantané pris avant l'arrêt des minuteries (délai restant)
+        pending = self._storage_data() if self._save_pending else None
         if self._unsub_tracker:
             self._unsub_tracker()
             self._unsub_tracker = None
+        if self._unsub_devices:
+            self._unsub_devices()
+            self._unsub_devices = None
+        self._cancel_flush()
+        self._cancel_recovery_timer()
+        self._cancel_overload_timer()
+        self._cancel_schedule_timer()
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        self._pending_power = None
+        for fut in self._sample_waiters:
+            if not fut.done():
+                fut.cancel()
+        self._sample_waiters = []
+        if pending is not None:
+            await self._store.async_save(pending)
+
+    # ──────────────────────────────────────────────────────────────
+    # Persistance
+    # ──────────────────────────────────────────────────────────────
+
+    async def _async_restore_state(self):
+        """Restaure les équipements délestés et le délai de réarmement."""
+        stored = await self._store.async_load()
+        if not stored:
+            return
+
+        # Cumuls délestés d'abord : le tas des candidats en dépend
+        for entity_id, seconds in stored.get("shed_time", {}).items():
+            if entity_id in self._by_entity:
+                self.shed_time[entity_id] = float(seconds)
+        self._build_shed_heap()
+        for entity_id in stored.get("devices_shed", []):
+            eq = self._by_entity.get(entity_id)
+            if eq is not None:
+                self._mark_shed(eq)
+        for entity_id, (reduction, base) in stored.get("throttled", {}).items():
+            eq = self._by_entity.get(entity_id)
+            if eq is not None and eq.modulating:
+                self._reduction[eq.index] = reduction
+                self._base_setpoint[eq.index] = base
+                self._dirty.add(eq.index)
+        self.last_shed_time = _parse_dt(stored.get("last_shed_time"))
+        self.last_recovery_time = _parse_dt(stored.get("last_recovery_time"))
+
+        if not self.devices_shed:
+            self._saved_signature = self._state_signature()
+            return
+
+        self.state = STATE_SHEDDING
+        remaining = stored.get("recovery_remaining")
+        saved_at = _parse_dt(stored.get("saved_at"))
+        if remaining is not None and saved_at is not None:
+            # Le délai reprend là où il s'était arrêté (temps d'arrêt déduit)
+            downtime = max(0.0, (datetime.now() - saved_at).total_seconds())
+            remaining = min(self.recovery_delay, max(0.0, remaining - downtime))
+            self._start_recovery_timer(remaining)
+            self.state = STATE_RECOVERING
+
+        self._saved_signature = self._state_signature()
+        _LOGGER.info(
+            "État restauré : %d équipement(s) délesté(s), état %s",
+            len(self.devices_shed), self.state,
+        )
+
+    def _state_signature(self):
+        return (
+            self.state, tuple(self.devices_shed), self._recovery_deadline is None,
+            self._level_version,
+        )
+
+    def _save_if_changed(self):
+        """Programme une écriture différée si l'état de délestage a transité."""
+        signature = self._state_signature()
+        if signature != self._saved_signature:
+            self._saved_signature = signature
+            self._save_pending = True
+            self._store.async_delay_save(self._storage_data, STORAGE_SAVE_DELAY)
+
+    @callback
+    def _storage_data(self) -> dict:
+        self._save_pending = False
+        return {
+            "state":              self.state,
+            "devices_shed":       list(self.devices_shed),
+            "last_shed_time":     self.last_shed_time.isoformat()
+                                  if self.last_shed_time else None,
+            "last_recovery_time": self.last_recovery_time.isoformat()
+                                  if self.last_recovery_time else None,
+            "recovery_remaining": self._get_recovery_countdown(),
+            # Charges modulées : réduction (unités) et consigne de base à rendre
+            "throttled":          {
+                eq.entity_id: [self._reduction[eq.index], self._base_setpoint[eq.index]]
+                for eq in self._modulating if self._reduction[eq.index]
+            },
+            # Équité : cumul des délestages terminés par équipement (s)
+            "shed_time":          {e: round(t, 1) for e, t in self.shed_time.items()},
+            "saved_at":           datetime.now().isoformat(),
+        }
 
     # ──────────────────────────────────────────────────────────────
     # Helpers internes
     # ──────────────────────────────────────────────────────────────
 
-    def _get_recovery_countdown(self):
-        """Secondes restantes avant réarmement."""
-        if self._recovery_start is None:
-            return None
-        elapsed = (datetime.now() - self._recovery_start).total_seconds()
-        return max(0, round(self.recovery_delay - elapsed))
-
-    def _get_device_power(self, eq: dict) -> float:
-        """Puissance réelle d'un équipement."""
-        entity_id = eq.get(CONF_DEVICE_ENTITY, "")
-        mode = eq.get(CONF_DEVICE_POWER_MODE, "fixed")
-
-        if mode == "sensor":
-            sensor_id = eq.get(CONF_DEVICE_PWR_SENSOR, "")
-            if sensor_id:
-                s = self.hass.states.get(sensor_id)
-                if s and s.state not in ("unavailable", "unknown", None):
-                    try:
-                        return float(s.state)
-                    except (ValueError, TypeError):
-                        pass
-            return 0.0
-        else:
-            # Puissance fixe — retourne 0 si l'équipement est éteint
-            s = self.hass.states.get(entity_id)
-            if s and s.state not in ("off", "unavailable", "unknown"):
-                try:
-                    return float(eq.get(CONF_DEVICE_FIXED_PWR, 0))
-                except (ValueError, TypeError):
-                    return 0.0
-            return 0.0
+    def _request_decision(self):
+        """Échéance (réarmement, budget de surcharge) : décision sur la dernière valeur."""
+        current_power = self._read_main_power()
+        if current_power is not None:
+            self._submit(current_power)
+
+    # ──────────────────────────────────────────────────────────────
+    # Cache d'états des équipements
+    # ──────────────────────────────────────────────────────────────
+
+    @callback
+    def _device_changed(self, event):
+        """Callback temps réel sur un équipement ou son capteur de puissance."""
+        self._update_cache(event.data["entity_id"], event.data.get("new_state"))
+        # Une décision en cours publiera elle-même à la fin
+        if not self._deciding and self.data is not None:
+            self._publish(self.data.get("current_power", 0.0))
+
+    def device_view(self, eq: Equipment):
+        """Vue publiée d'un équipement (même objet tant qu'elle n'a pas changé)."""
+        return self._device_views[eq.index]
 
     def _build_data(self, current_power: float) -> dict:
-        """Construit le dict de données exposé aux sensors."""
+        """Construit le dict de données exposé aux sensors.
+
+        Seules les vues des équipements marqués sales (événement d'état,
+        capteur de puissance ou statut de délestage) sont recréées ; la liste
+        ``all_devices`` reste le même objet tant qu'aucune vue n'a bougé.
+        """
+        if self._dirty:
+            views = self._device_views
+            changed = False
+            for i in self._dirty:
+                eq = self.table[i]
+                view = {
+                    "name":      eq.name,
+                    "entity_id": eq.entity_id,
+                    "priority":  eq.priority,
+                    "power":     self._get_device_power(eq),
+                    "status":    self._status[i],
+                    "shed":      eq.entity_id in self._shed_ids,
+                    "reduction": self.reduction_power(eq),
+                    "shed_time": round(self.shed_seconds(eq)),
+                }
+                # Vue identique (ex. attribut seul modifié) : on garde l'ancien objet
+                if view != views[i]:
+                    views[i] = view
+                    changed = True
+            self._dirty.clear()
+            if changed or len(self._all_devices) != len(views):
+                self._all_devices = list(views)
+        all_devices = self._all_devices
+
         shed_power = 0.0
-        all_devices = []
-
-        for eq in self.equipments:
-            entity_id = eq.get(CONF_DEVICE_ENTITY, "")
-            is_shed = entity_id in self.devices_shed
-            power = self._get_device_power(eq)
-            s = self.hass.states.get(entity_id)
-
-            if is_shed:
-                shed_power += float(eq.get(CONF_DEVICE_FIXED_PWR, 0))
-
-            all_devices.append({
-                "name":      eq.get(CONF_DEVICE_NAME, entity_id),
-                "entity_id": entity_id,
-                "priority":  int(float(eq.get(CONF_DEVICE_PRIORITY, 99))),
-                "power":     power,
-                "status":    s.state if s else "inconnu",
-                "shed":      is_shed,
-            })
+        for entity_id in self.devices_shed:
+            eq = self._by_entity.get(entity_id)
+            if eq is not None:
+                shed_power += eq.fixed_power
 
         return {
             "state":               self.state,
@@ -139,11 +325,23 @@ class DelestageCoordinator(DataUpdateCoordinator):
             "devices_shed":        self.devices_shed,
             "devices_shed_count":  len(self.devices_shed),
             "total_power_shed":    shed_power,
-            "recovery_countdown":  self._get_recovery_countdown(),
+            "total_power_throttled": self.throttled_power(),
+            "tariff":              self.tariff,
+            "next_threshold_at":   self.next_threshold_at.isoformat()
+                                   if self.next_threshold_at else None,
+            "charger_limit":       self._charger_limit,
+            "charger_budget":      round(self.charger_budget)
+                                   if self.charger_budget is not None else None,
+            "recovery_at":         self._recovery_at.isoformat()
+                                   if self._recovery_at else None,
             "last_shed_time":      str(self.last_shed_time)
                                    if self.last_shed_time else None,
             "last_recovery_time":  str(self.last_recovery_time)
                                    if self.last_recovery_time else None,
+            "last_relief_time":    self.last_relief_time,
+            "overload_percent":    self.overload_percent(),
+            "sensor_stale":        self.sensor_stale,
+            "startup_time_ms":     self.startup_time,
             "all_devices":         all_devices,
         }
 
@@ -151,20 +349,69 @@ class DelestageCoordinator(DataUpdateCoordinator):
     # Polling + temps réel
     # ──────────────────────────────────────────────────────────────
 
-    async def _async_update_data(self):
-        """Polling toutes les 5 s."""
+    def _check_stale(self):
+        """Repasse en polling rapide si le capteur principal se tait.
+
+        Le polling étiré vaut la moitié du seuil : un silence est détecté
+        au plus tard 1,5 × ``stale_timeout`` après le dernier push.
+        """
+        quiet = (
+            self._last_push is not None
+            and time.monotonic() - self._last_push > self.stale_timeout
+        )
+        if quiet and not self.sensor_stale:
+            self.sensor_stale = True
+            self.update_interval = FAST_POLL_INTERVAL
+            _LOGGER.warning(
+                "Aucune mise à jour de %s depuis %.0f s : polling rapide",
+                self.power_sensor, self.stale_timeout,
+            )
+
+    def _mark_push_alive(self):
+        """Un échantillon poussé est arrivé : polling étiré jusqu'au seuil de fraîcheur."""
+        self._last_push = time.monotonic()
+        if self.sensor_stale or self.update_interval == FAST_POLL_INTERVAL:
+            if self.sensor_stale:
+                _LOGGER.info("%s de nouveau actif : polling ralenti", self.power_sensor)
+            self.sensor_stale = False
+            self.update_interval = timedelta(seconds=self.stale_timeout / 2)
+
+    def _read_main_power(self):
+        """Valeur courante du capteur principal (None si indisponible)."""
         s = self.hass.states.get(self.power_sensor)
         if s is None or s.state in ("unavailable", "unknown"):
-            return self._build_data(0.0)
+            return None
         try:
-            current_power = float(s.state)
+            return float(s.state)
         except (ValueError, TypeError):
+            return None
+
+    @callback
+    def async_prime(self):
+        """Évaluation initiale partagée, depuis le cache, sans appel de service."""
+        self.data = self._build_data(self._read_main_power() or 0.0)
+
+    async def async_start_decisions(self, _hass=None):
+        """Première décision, différée après le démarrage de Home Assistant."""
+        current_power = self._read_main_power()
+        if current_power is not None:
+            self._submit(current_power)
+
+    async def _async_update_data(self):
+        """Filet de sécurité : 5 s sans push, seuil de fraîcheur sinon."""
+        self._check_stale()
+        current_power = self._read_main_power()
+        if current_power is None:
             return self._build_data(0.0)
+        self._observe_sample(current_power)
 
-        await self._delestage_logic(current_power)
+        # L'acteur publiera lui-même le résultat de sa décision
+        if not self._deciding and self._queue.empty():
+            self._submit(current_power)
         return self._build_data(current_power)
 
-    async def _power_changed(self, event):
+    @callback
+    def _power_changed(self, event):
         """Callback temps réel sur changement de puissance."""
         new_state = event.data.get("new_state")
         if new_state is None or new_state.state in ("unavailable", "unknown"):
@@ -173,150 +420,113 @@ class DelestageCoordinator(DataUpdateCoordinator):
             current_power = float(new_state.state)
         except (ValueError, TypeError):
             return
-        await self._delestage_logic(current_power)
-        self.async_set_updated_data(self._build_data(current_power))
-
-    # ──────────────────────────────────────────────────────────────
-    # Logique de délestage
-    # ──────────────────────────────────────────────────────────────
-
-    async def _delestage_logic(self, current_power: float):
-        """Décision : délester ou réarmer."""
-        _LOGGER.debug(
-            "Puissance: %.0f W / seuil: %.0f W / état: %s | Délestage activé: %s",
-            current_power, self.max_power, self.state, self.enable_shedding
-        )
+        self._mark_push_alive()
+        self.samples_received += 1
+        self._observe_sample(current_power)
 
-        if not self.enable_shedding:
-            # Si le délestage est désactivé, on ne coupe rien et on réarme tout si besoin
-            if self.devices_shed:
-                _LOGGER.info("Délestage désactivé : réarmement de tous les équipements si besoin.")
-                await self._recover_devices(current_power)
-            self.state = STATE_IDLE
-            self._recovery_start = None
+        # Une décision attend l'effet de sa dernière action : l'échantillon lui revient
+        if self._deliver_sample(current_power):
             return
 
-        # ── Délestage nécessaire ───────────────────────────────
-        if current_power > self.max_power:
-            if self.state == STATE_RECOVERING:
-                self._recovery_start = None
-                self.state = STATE_SHEDDING
-
-            await self._shed_devices(current_power)
-
-        # ── En dessous du seuil → réarmement ──────────────────
-        elif self.state == STATE_SHEDDING and self.devices_shed:
-            threshold = self.max_power - self.rearm_margin
-            if current_power <= threshold:
-                if self._recovery_start is None:
-                    self._recovery_start = datetime.now()
-                    self.state = STATE_RECOVERING
-                    _LOGGER.info(
-                        "Délai de réarmement démarré (%.0f s)", self.recovery_delay
-                    )
-                elif (datetime.now() - self._recovery_start).total_seconds() \
-                        >= self.recovery_delay:
-                    await self._recover_devices(current_power)
-
-        # ── Récupération en cours : vérifier le délai ─────────
-        elif self.state == STATE_RECOVERING:
-            if self._recovery_start and \
-               (datetime.now() - self._recovery_start).total_seconds() \
-               >= self.recovery_delay:
-                await self._recover_devices(current_power)
-
-        # ── Idle propre ───────────────────────────────────────
-        elif not self.devices_shed:
-            self.state = STATE_IDLE
-            self._recovery_start = None
-
-    # ──────────────────────────────────────────────────────────────
-    # Délestage
-    # ──────────────────────────────────────────────────────────────
+        # Chemin rapide : une surcharge n'attend jamais la fenêtre de coalescence
+        now = time.monotonic()
+        if (
+            current_power > self.max_power
+            or self._last_processed is None
+            or now - self._last_processed >= self.min_interval
+        ):
+            self._submit(current_power)
+            return
 
-    async def _shed_devices(self, current_power: float):
-        """Coupe les équipements par ordre de priorité jusqu'à repasser sous le seuil."""
-        for eq in self.equipments:  # déjà trié par priorité
-            if current_power <= self.max_power:
-                break
-
-            entity_id = eq.get(CONF_DEVICE_ENTITY, "")
-            if entity_id in self.devices_shed:
-                continue
-
-            s = self.hass.states.get(entity_id)
-            if s is None or s.state in ("off", "unavailable", "unknown"):
-                continue
-
-            await self._turn_off(entity_id)
-            self.devices_shed.append(entity_id)
-            _LOGGER.info(
-                "Délestage : %s (priorité %s) — %.0f W",
-                entity_id,
-                eq.get(CONF_DEVICE_PRIORITY),
-                current_power,
+        # Rafale : on garde la dernière valeur et on traite en fin de fenêtre
+        if self._pending_power is not None:
+            self.samples_coalesced += 1
+        self._pending_power = current_power
+        if self._unsub_flush is None:
+            self._unsub_flush = async_call_later(
+                self.hass,
+                self.min_interval - (now - self._last_processed),
+                self._flush_pending,
             )
 
-            # Relire la puissance après coupure
-            s2 = self.hass.states.get(self.power_sensor)
-            if s2 and s2.state not in ("unavailable", "unknown"):
-                try:
-                    current_power = float(s2.state)
-                except (ValueError, TypeError):
-                    pass
-
-        self.state = STATE_SHEDDING
-        self.last_shed_time = datetime.now()
+    @callback
+    def _flush_pending(self, _now=None):
+        """Fin de fenêtre de coalescence : soumet le dernier échantillon."""
+        self._unsub_flush = None
+        if self._pending_power is not None:
+            self._submit(self._pending_power)
 
     # ──────────────────────────────────────────────────────────────
-    # Réarmement
+    # Acteur de décision (écrivain unique)
     # ──────────────────────────────────────────────────────────────
 
-    async def _recover_devices(self, current_power: float):
-        """Rallume les équipements dans l'ordre inverse de priorité."""
-        recovered = []
-
-        for entity_id in reversed(list(self.devices_shed)):
-            await self._turn_on(entity_id)
-
-            s = self.hass.states.get(self.power_sensor)
+    @callback
+    def _discard_stale_samples(self):
+        """Vide la file et la fenêtre de coalescence : valeurs d'avant l'action."""
+        self._cancel_flush()
+        self._pending_power = None
+        while not self._queue.empty():
+            self._queue.get_nowait()
+            self.samples_dropped += 1
+
+    @callback
+    def _submit(self, current_power: float):
+        """Dépose un échantillon pour l'acteur ; le plus récent remplace l'attente."""
+        self._cancel_flush()
+        self._pending_power = None
+        self._last_processed = time.monotonic()
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.samples_dropped += 1
+        self._queue.put_nowait(current_power)
+        depth = self._queue.qsize() + (1 if self._deciding else 0)
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+
+    async def _decision_worker(self):
+        """Exécute les décisions une à une : jamais deux _delestage_logic en parallèle."""
+        while True:
+            current_power = await self._queue.get()
+            self._deciding = True
+            start = time.monotonic()
             try:
-                current_power = float(s.state) if s else current_power
-            except (ValueError, TypeError):
-                pass
-
-            if current_power > self.max_power:
-                await self._turn_off(entity_id)
-                _LOGGER.warning(
-                    "Réarmement annulé pour %s : %.0f W > seuil %.0f W",
-                    entity_id, current_power, self.max_power
-                )
-                break
-
-            recovered.append(entity_id)
-            _LOGGER.info("Réarmement OK : %s", entity_id)
-
-        self.devices_shed = [d for d in self.devices_shed if d not in recovered]
-        self.last_recovery_time = datetime.now()
-        self._recovery_start = None
-        self.state = STATE_IDLE if not self.devices_shed else STATE_SHEDDING
-
-    # ──────────────────────────────────────────────────────────────
-    # Helpers turn_on / turn_off
-    # ──────────────────────────────────────────────────────────────
-
-    async def _turn_off(self, entity_id: str):
-        domain = entity_id.split(".")[0]
-        _LOGGER.info(f"[Délestage] Désactivation demandée pour {entity_id} (domain: {domain})")
-        await self.hass.services.async_call(
-            domain, "turn_off", {"entity_id": entity_id}, blocking=True
-        )
-        _LOGGER.info(f"[Délestage] Désactivation effectuée pour {entity_id}")
+                await self._delestage_logic(current_power)
+            except Exception:  # l'acteur doit survivre à un service défaillant
+                _LOGGER.exception("Erreur pendant la décision de délestage")
+            finally:
+                self._deciding = False
+            self.decision_latency.record(time.monotonic() - start)
+            self.decisions += 1
+            self._save_if_changed()
+            self._publish(current_power)
+
+    def decision_metrics(self) -> dict:
+        """Compteurs de l'acteur de décision (diagnostics)."""
+        return {
+            "queue_depth":       self._queue.qsize() + (1 if self._deciding else 0),
+            "max_queue_depth":   self.max_queue_depth,
+            "samples_received":  self.samples_received,
+            "samples_coalesced": self.samples_coalesced,
+            "samples_dropped":   self.samples_dropped,
+            "decisions":         self.decisions,
+        }
 
-    async def _turn_on(self, entity_id: str):
-        domain = entity_id.split(".")[0]
-        _LOGGER.info(f"[Délestage] Activation demandée pour {entity_id} (domain: {domain})")
-        await self.hass.services.async_call(
-            domain, "turn_on", {"entity_id": entity_id}, blocking=True
-        )
-        _LOGGER.info(f"[Délestage] Activation effectuée pour {entity_id}")
+    def _publish(self, current_power: float):
+        """Notifie les entités seulement si le snapshot a réellement changé."""
+        data = self._build_data(current_power)
+        if data != self.data:
+            self.async_set_updated_data(data)
+
+    def _cancel_flush(self):
+        if self._unsub_flush:
+            self._unsub_flush()
+            self._unsub_flush = None
+
+
+def _parse_dt(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,24 @@
+"""Diagnostics de l'intégration Délestage (téléchargement à la demande)."""
+from homeassistant.core import HomeAssistant
+from homeassistant.config_entries import ConfigEntry
+from .const import DOMAIN
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict:
+    """Vue complète par équipement, hors historique du recorder."""
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+    data = coordinator.data or {}
+    return {
+        "config": {**entry.data, **entry.options},
+        "state": coordinator.state,
+        "startup_time_ms": coordinator.startup_time,
+        "decision_metrics": coordinator.decision_metrics(),
+        "latency": coordinator.latency_metrics(),
+        "prediction": coordinator.prediction_metrics(),
+        "devices_shed": list(coordinator.devices_shed),
+        "data": {k: v for k, v in data.items() if k != "all_devices"},
+        "all_devices": data.get("all_devices", []),
+        "decision_log": coordinator.decision_log(),
+    }
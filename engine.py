@@ -0,0 +1,1232 @@
+"""Cœur de décision du délestage, indépendant de Home Assistant.
+
+``DelestageEngine`` porte la logique (délestage, réarmement, échéance) et
+s'appuie sur un ``Backend`` pour l'horloge, les minuteries et les appels de
+service : ``HassBackend`` dans le coordinateur, ``SimBackend`` dans l'outil
+de rejeu hors ligne (replay.py).
+"""
+import asyncio
+import heapq
+import logging
+import math
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from .const import *
+from .equipment import Equipment, compile_equipments
+from .metrics import LatencyHistogram
+from .schedule import parse_schedule
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Backend(ABC):
+    """Services externes utilisés par le moteur de décision."""
+
+    @abstractmethod
+    def monotonic(self) -> float:
+        """Horloge monotone en secondes (échéances, mesures de durée)."""
+
+    @abstractmethod
+    def now(self) -> datetime:
+        """Heure locale avec fuseau (plages horaires, horodatage des actions)."""
+
+    @abstractmethod
+    def utcnow(self) -> datetime:
+        """Heure UTC avec fuseau (échéance publiée)."""
+
+    @abstractmethod
+    def call_later(self, delay: float, action):
+        """Appelle ``action()`` après ``delay`` s ; retourne une fonction d'annulation."""
+
+    @abstractmethod
+    def create_future(self):
+        """Future de la boucle du backend (attente d'un échantillon)."""
+
+    @abstractmethod
+    async def wait_for(self, aw, timeout: float):
+        """Comme ``asyncio.wait_for`` sur l'horloge du backend."""
+
+    @abstractmethod
+    async def call_service(self, domain: str, service: str, entity_id: str,
+                           data: dict | None = None):
+        """Appel de service bloquant (turn_on / turn_off, consignes)."""
+
+
+class DelestageEngine(ABC):
+    """Décisions de délestage et de réarmement sur la table d'équipements."""
+
+    def _init_engine(self, backend: Backend):
+        """État d'exécution du moteur (avant ``_configure``)."""
+        self.backend = backend
+        self.state = STATE_IDLE
+        self.devices_shed = []
+        self._shed_ids = set()
+        self.last_shed_time = None
+        self.last_recovery_time = None
+        self.last_relief_time = None
+        # Réarmement : échéance unique sur horloge monotone
+        self._recovery_deadline = None
+        self._recovery_at = None
+        self._unsub_recovery = None
+        # Tolérance de surcharge : énergie intégrée sur le dernier échantillon tenu
+        self._overload_energy = 0.0
+        self._overload_sample = None
+        self._unsub_overload = None
+        # Prédiction : régression linéaire incrémentale sur une fenêtre glissante
+        self._window = deque()
+        self._trend_origin = 0.0
+        self._sums = [0.0, 0.0, 0.0, 0.0]  # Σt, Σp, Σt², Σtp
+        self._prediction = None            # [échéance, puissance coupée, confirmée, ids]
+        self.predictions = {"made": 0, "confirmed": 0, "false_alarm": 0, "missed": 0}
+        # Rétroaction : décision en cours + attente du prochain échantillon
+        self._deciding = False
+        self._sample_waiters = []
+        self._last_sample = None
+        # Latences de réaction : dépassement → 1re coupure, retour sous le seuil
+        self._over_since = None
+        self._reaction_pending = False
+        self.reaction_latency = LatencyHistogram()
+        self.overload_duration = LatencyHistogram()
+        self.decision_latency = LatencyHistogram()
+        self.service_latency = {}
+        # Équité : cumul des délestages terminés (s) et début du délestage en cours
+        self.shed_time = {}
+        self._shed_since = {}
+        self._last_shed = {}
+        # Journal borné des décisions : tuples bruts, aucun formatage à chaud
+        self._decision_log = deque(maxlen=DECISION_LOG_SIZE)
+        # Borne de recharge : dernière limite publiée, puissance tirée mesurée
+        self._charger_draw = None
+        self._charger_limit = None
+        self._charger_raised_at = None
+        self.charger_budget = None
+        # Seuils planifiés : bascule armée sur la prochaine frontière de plage
+        self.tariff = None
+        self.next_threshold_at = None
+        self._unsub_schedule = None
+
+    def _configure(self, cfg: dict):
+        """Paramètres de décision et table compilée depuis data + options."""
+        self.max_power      = float(cfg.get(CONF_MAX_POWER, 6000))
+        self.recovery_delay = float(cfg.get(CONF_RECOVERY_DELAY, 300))
+        self.rearm_margin   = float(cfg.get(CONF_REARM_MARGIN, 0))
+        self.parallel_shed  = bool(cfg.get(CONF_PARALLEL_SHED, False))
+        self.shed_timeout   = float(cfg.get(CONF_SHED_TIMEOUT, DEFAULT_SHED_TIMEOUT))
+        self.settle_timeout = float(cfg.get(CONF_SETTLE_TIMEOUT, DEFAULT_SETTLE_TIMEOUT))
+        self.shed_concurrency = max(
+            1, int(cfg.get(CONF_SHED_CONCURRENCY, DEFAULT_SHED_CONCURRENCY))
+        )
+        self.overload_budget = float(cfg.get(CONF_OVERLOAD_BUDGET, DEFAULT_OVERLOAD_BUDGET))
+        self.hard_max_power = float(cfg.get(CONF_HARD_MAX_POWER, DEFAULT_HARD_MAX_POWER))
+        self.predict_horizon = float(cfg.get(CONF_PREDICT_HORIZON, DEFAULT_PREDICT_HORIZON))
+        self.enable_shedding = cfg.get("enable_shedding", True)
+        self._configure_charger(cfg)
+        self._configure_schedule(cfg)
+        # Table compilée une fois : priorité, domaine, puissances pré-analysés
+        self.table          = compile_equipments(cfg.get(CONF_EQUIPMENTS, []))
+        self.equipments     = [eq.raw for eq in self.table]
+        self._by_entity     = {eq.entity_id: eq for eq in self.table}
+        # Cache alimenté par les événements, indexé par Equipment.index
+        n = len(self.table)
+        self._status       = ["inconnu"] * n
+        self._sensor_power = [None] * n
+        # Dernière puissance mesurée en marche (capteur) : estimation au rallumage
+        self._running_power = [0.0] * n
+        # Charges modulables : réduction courante (unités) et consigne de base
+        self._modulating = [eq for eq in self.table if eq.modulating]
+        self._reduction = [0.0] * n
+        self._base_setpoint = [None] * n
+        # Incrémenté à chaque niveau appliqué : signature de persistance en O(1)
+        self._level_version = 0
+        self._watch = {}
+        for eq in self.table:
+            self._watch.setdefault(eq.entity_id, []).append(eq.index)
+            if eq.power_sensor:
+                self._watch.setdefault(eq.power_sensor, []).append(eq.index)
+        # Suivis par le même abonnement que les équipements, sans vue associée
+        if self.charger_sensor:
+            self._watch.setdefault(self.charger_sensor, [])
+        if self.tariff_entity:
+            self._watch.setdefault(self.tariff_entity, [])
+        self._dirty = set(range(n))
+        self.service_latency = {
+            e: h for e, h in self.service_latency.items() if e in self._by_entity
+        }
+        self.shed_time = {e: t for e, t in self.shed_time.items() if e in self._by_entity}
+        self._build_shed_heap()
+
+    # ──────────────────────────────────────────────────────────────
+    # Échéance de réarmement
+    # ──────────────────────────────────────────────────────────────
+
+    def _get_recovery_countdown(self):
+        """Secondes restantes avant réarmement."""
+        if self._recovery_deadline is None:
+            return None
+        return max(0, round(self._recovery_deadline - self.backend.monotonic()))
+
+    def _start_recovery_timer(self, delay: float | None = None):
+        """Arme l'échéance de réarmement (une seule à la fois)."""
+        delay = self.recovery_delay if delay is None else delay
+        self._cancel_recovery_timer()
+        self._recovery_deadline = self.backend.monotonic() + delay
+        self._recovery_at = self.backend.utcnow() + timedelta(seconds=delay)
+        self._unsub_recovery = self.backend.call_later(delay, self._recovery_due)
+
+    def _cancel_recovery_timer(self):
+        if self._unsub_recovery:
+            self._unsub_recovery()
+            self._unsub_recovery = None
+        self._recovery_deadline = None
+        self._recovery_at = None
+
+    def _recovery_elapsed(self) -> bool:
+        return (
+            self._recovery_deadline is not None
+            and self.backend.monotonic() >= self._recovery_deadline
+        )
+
+    def _recovery_due(self):
+        """Échéance atteinte : le porteur du moteur relance une décision."""
+        self._unsub_recovery = None
+        if self._recovery_deadline is None:
+            return
+        # Le timer de la boucle peut devancer l'horloge monotone de quelques µs
+        self._recovery_deadline = min(self._recovery_deadline, self.backend.monotonic())
+        self._request_decision()
+
+    @abstractmethod
+    def _request_decision(self):
+        """Relance une décision sur la dernière valeur du compteur (porteur)."""
+
+    @abstractmethod
+    def _discard_stale_samples(self):
+        """Oublie les échantillons en attente de décision (porteur)."""
+
+    # ──────────────────────────────────────────────────────────────
+    # Tolérance de surcharge (I²t)
+    # ──────────────────────────────────────────────────────────────
+
+    def _overload_rate(self, power: float) -> float:
+        """Échauffement en W : (P² − Pmax²) / 2·Pmax, ≈ P − Pmax près du seuil.
+
+        Quadratique comme la courbe d'un disjoncteur (I²t à tension
+        constante) ; négatif sous le seuil, ce qui refroidit le budget.
+        """
+        return (power * power - self.max_power * self.max_power) / (2 * self.max_power)
+
+    def _overload_energy_at(self, now: float) -> float:
+        if self._overload_sample is None:
+            return self._overload_energy
+        since, power = self._overload_sample
+        return max(0.0, self._overload_energy + self._overload_rate(power) * (now - since))
+
+    def _integrate_overload(self, current_power: float):
+        """Cumule l'énergie de surcharge jusqu'à cet échantillon (O(1))."""
+        if not self.overload_budget or self.max_power <= 0:
+            return
+        now = self.backend.monotonic()
+        self._overload_energy = self._overload_energy_at(now)
+        self._overload_sample = (now, current_power)
+
+    def overload_percent(self):
+        """Part du budget de surcharge consommée (None si la tolérance est inactive)."""
+        if not self.overload_budget:
+            return None
+        energy = self._overload_energy_at(self.backend.monotonic())
+        return round(min(100.0, 100 * energy / self.overload_budget))
+
+    def _shed_reason(self, current_power: float):
+        """Motif de délestage au-dessus de max_power, None si la surcharge est tolérée."""
+        if not self.overload_budget:
+            return "overload"
+        if self.hard_max_power and current_power >= self.hard_max_power:
+            return "hard_limit"
+        energy = self._overload_energy_at(self.backend.monotonic())
+        if energy >= self.overload_budget * (1 - 1e-9):
+            return "overload_budget"
+        return None
+
+    def _arm_overload_timer(self, current_power: float):
+        """Planifie une décision à l'épuisement prévu du budget."""
+        self._cancel_overload_timer()
+        rate = self._overload_rate(current_power)
+        if rate <= 0:
+            return
+        energy = self._overload_energy_at(self.backend.monotonic())
+        delay = max(0.0, (self.overload_budget - energy) / rate)
+        self._unsub_overload = self.backend.call_later(delay, self._overload_due)
+
+    def _cancel_overload_timer(self):
+        if self._unsub_overload:
+            self._unsub_overload()
+            self._unsub_overload = None
+
+    def _overload_due(self):
+        self._unsub_overload = None
+        self._request_decision()
+
+    # ──────────────────────────────────────────────────────────────
+    # Prédiction de tendance
+    # ──────────────────────────────────────────────────────────────
+
+    def _update_trend(self, current_power: float):
+        """Ajoute l'échantillon à la fenêtre et met à jour les sommes (O(1))."""
+        if not self.predict_horizon:
+            return
+        now = self.backend.monotonic()
+        if not self._window:
+            self._trend_origin = now
+        elif now - self._trend_origin > 3600:
+            # Rebase rare : garde des sommes de petits nombres (précision)
+            shift = self._window[0][0]
+            self._trend_origin += shift
+            self._window = deque((t - shift, p) for t, p in self._window)
+            self._sums = [
+                sum(t for t, _ in self._window),
+                sum(p for _, p in self._window),
+                sum(t * t for t, _ in self._window),
+                sum(t * p for t, p in self._window),
+            ]
+        sums = self._sums
+        t = now - self._trend_origin
+        self._window.append((t, current_power))
+        sums[0] += t
+        sums[1] += current_power
+        sums[2] += t * t
+        sums[3] += t * current_power
+        if len(self._window) > PREDICT_WINDOW:
+            t, p = self._window.popleft()
+            sums[0] -= t
+            sums[1] -= p
+            sums[2] -= t * t
+            sums[3] -= t * p
+
+    def _restart_trend(self, current_power=None):
+        """Vide la fenêtre : nos propres actions ne sont pas une tendance.
+
+        Appelé après chaque commande du moteur, puis avec l'échantillon qui
+        en montre l'effet : la pente repart du nouveau palier.
+        """
+        self._window.clear()
+        self._sums = [0.0, 0.0, 0.0, 0.0]
+        if current_power is not None:
+            self._update_trend(current_power)
+
+    def _trend_slope(self):
+        """Pente en W/s par moindres carrés sur la fenêtre (None si indéfinie)."""
+        n = len(self._window)
+        if n < 3:
+            return None
+        st, sp, stt, stp = self._sums
+        den = n * stt - st * st
+        if den <= 1e-9:
+            return None
+        return (n * stp - st * sp) / den
+
+    def _score_prediction(self, current_power: float):
+        """Confirme la prédiction active si la charge coupée aurait fait dépasser."""
+        pred = self._prediction
+        if pred is None:
+            return
+        if not pred[2] and current_power + pred[1] > self.max_power:
+            pred[2] = True
+            self.predictions["confirmed"] += 1
+        if self.backend.monotonic() >= pred[0]:
+            self._settle_prediction()
+
+    def _settle_prediction(self):
+        """Clôt la prédiction active ; non confirmée, c'est une fausse alerte."""
+        if self._prediction is not None and not self._prediction[2]:
+            self.predictions["false_alarm"] += 1
+        self._prediction = None
+
+    def prediction_metrics(self) -> dict:
+        """Compteurs de prédiction et précision (%) pour régler l'horizon."""
+        made = self.predictions["made"]
+        settled = self.predictions["confirmed"] + self.predictions["false_alarm"]
+        return {
+            **self.predictions,
+            "horizon": self.predict_horizon,
+            "precision": round(100 * self.predictions["confirmed"] / settled, 1)
+                         if settled else None,
+            "pending": made - settled,
+        }
+
+    async def _preempt_shed(self, current_power: float) -> bool:
+        """Coupe par anticipation si la tendance dépasse max_power dans l'horizon."""
+        if not self.predict_horizon or self._prediction is not None:
+            return False
+        slope = self._trend_slope()
+        if slope is None or slope <= 0:
+            return False
+        projected = current_power + slope * self.predict_horizon
+        if projected <= self.max_power:
+            return False
+        batch = self._plan_shed(projected)
+        if not batch:
+            return False
+
+        if self.state == STATE_RECOVERING:
+            self._cancel_recovery_timer()
+        shed_power = sum(self._get_device_power(eq) for eq in batch)
+        self._prediction = [
+            self.backend.monotonic() + self.predict_horizon, shed_power, False,
+            {eq.entity_id for eq in batch},
+        ]
+        self.predictions["made"] += 1
+        self._record(projected, "predict", reason="trend")
+        _LOGGER.info(
+            "Délestage prédictif : %.0f W projetés dans %.0f s (pente %.1f W/s)",
+            projected, self.predict_horizon, slope,
+        )
+        await self._dispatch_shed(batch, current_power, "predicted")
+        self.state = STATE_SHEDDING
+        self.last_shed_time = self.backend.now()
+        return True
+
+    # ──────────────────────────────────────────────────────────────
+    # Échantillons et état des équipements
+    # ──────────────────────────────────────────────────────────────
+
+    async def async_wait_next_sample(self, timeout: float | None = None):
+        """Attend le prochain échantillon du compteur (None si délai dépassé)."""
+        fut = self.backend.create_future()
+        self._sample_waiters.append(fut)
+        try:
+            return await self.backend.wait_for(
+                fut, self.settle_timeout if timeout is None else timeout
+            )
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            if fut in self._sample_waiters:
+                self._sample_waiters.remove(fut)
+
+    def _deliver_sample(self, current_power: float) -> bool:
+        """Remet l'échantillon à une décision qui l'attend ; True s'il est consommé."""
+        if not self._sample_waiters:
+            return False
+        waiters, self._sample_waiters = self._sample_waiters, []
+        # Premier palier après notre action : la tendance repart de lui, et les
+        # valeurs reçues avant (pendant l'appel) ne doivent plus être rejouées
+        self._restart_trend(current_power)
+        self._discard_stale_samples()
+        for fut in waiters:
+            if not fut.done():
+                fut.set_result(current_power)
+        return True
+
+    def _observe_sample(self, current_power: float):
+        """Suivi par échantillon, avant toute décision (ingestion du porteur)."""
+        self._last_sample = current_power
+        self._score_prediction(current_power)
+        self._track_threshold(current_power)
+        self._integrate_overload(current_power)
+        self._update_trend(current_power)
+
+    def _track_threshold(self, current_power: float):
+        """Horodate le franchissement du seuil et mesure la durée du dépassement."""
+        if current_power > self.max_power:
+            if self._over_since is None:
+                self._over_since = self.backend.monotonic()
+                self._reaction_pending = True
+                if self.predict_horizon and self._prediction is None:
+                    self.predictions["missed"] += 1
+        elif self._over_since is not None:
+            self.overload_duration.record(self.backend.monotonic() - self._over_since)
+            self._over_since = None
+            self._reaction_pending = False
+
+    def latency_metrics(self) -> dict:
+        """Résumé des histogrammes de latence (capteurs de diagnostic)."""
+        return {
+            "reaction":  self.reaction_latency.summary(),
+            "overload":  self.overload_duration.summary(),
+            "decision":  self.decision_latency.summary(),
+            "service":   {e: h.summary() for e, h in self.service_latency.items()},
+        }
+
+    def _record(self, power, action: str, device=None, reason=None,
+                latency=None, ok=True):
+        """Ajoute une entrée au journal des décisions (O(1), sans formatage)."""
+        self._decision_log.append(
+            (self.backend.now(), power, action, device, reason, latency, ok)
+        )
+
+    def decision_log(self) -> list:
+        """Journal des décisions, du plus ancien au plus récent (diagnostics)."""
+        return [
+            {
+                "time":       ts.isoformat(),
+                "power":      power,
+                "action":     action,
+                "device":     device,
+                "reason":     reason,
+                "latency_ms": round(latency * 1000, 1) if latency is not None else None,
+                "ok":         ok,
+            }
+            for ts, power, action, device, reason, latency, ok in self._decision_log
+        ]
+
+    async def _watch_inrush(self, window: float, current_power: float) -> float:
+        """Suit le compteur pendant une fenêtre d'appel de courant.
+
+        Retourne la dernière mesure à l'échéance, ou le premier échantillon
+        au-dessus de ``max_power`` : une surcharge n'attend pas la fin de la
+        fenêtre, la décision rend la main au délestage.
+        """
+        deadline = self.backend.monotonic() + window
+        while True:
+            left = deadline - self.backend.monotonic()
+            if left <= 0:
+                return current_power
+            fresh = await self.async_wait_next_sample(left)
+            if fresh is None:
+                return current_power
+            current_power = fresh
+            if current_power > self.max_power:
+                return current_power
+
+    def _mark_shed(self, eq: Equipment):
+        """Enregistre un équipement comme délesté (liste ordonnée + set)."""
+        if eq.entity_id not in self._shed_ids:
+            self._shed_ids.add(eq.entity_id)
+            # Copie sur écriture : le snapshot publié ne change pas sous les entités
+            self.devices_shed = self.devices_shed + [eq.entity_id]
+            self._dirty.add(eq.index)
+            now = self.backend.monotonic()
+            self._shed_since[eq.entity_id] = now
+            self._last_shed[eq.entity_id] = now
+            # Son entrée dans le tas devient périmée
+            self._heap_version[eq.index] += 1
+
+    def _mark_recovered(self, entity_ids):
+        """Retire des équipements de l'état délesté."""
+        done = set(entity_ids)
+        if done:
+            was_shed = done & self._shed_ids
+            # Rallumer la charge anticipée fausserait la confirmation : on clôt
+            if self._prediction is not None and done & self._prediction[3]:
+                self._settle_prediction()
+            self._shed_ids -= done
+            self.devices_shed = [d for d in self.devices_shed if d not in done]
+            now = self.backend.monotonic()
+            for entity_id in done:
+                since = self._shed_since.pop(entity_id, None)
+                eq = self._by_entity.get(entity_id)
+                if eq is not None:
+                    if since is not None:
+                        self.shed_time[entity_id] = (
+                            self.shed_time.get(entity_id, 0.0) + now - since
+                        )
+                    self._dirty.add(eq.index)
+                    if entity_id in was_shed:
+                        self._push_candidate(eq)
+
+    # ──────────────────────────────────────────────────────────────
+    # Rotation équitable des candidats au délestage
+    # ──────────────────────────────────────────────────────────────
+
+    def _build_shed_heap(self):
+        """Tas des candidats : priorité, cumul délesté, dernier délestage."""
+        self._heap_version = [0] * len(self.table)
+        self._shed_heap = []
+        for eq in self.table:
+            if eq.entity_id not in self._shed_ids:
+                self._push_candidate(eq)
+
+    def _push_candidate(self, eq: Equipment):
+        if eq.modulating:
+            return
+        heapq.heappush(self._shed_heap, (
+            eq.priority,
+            self.shed_time.get(eq.entity_id, 0.0),
+            self._last_shed.get(eq.entity_id, -math.inf),
+            eq.index,
+            self._heap_version[eq.index],
+        ))
+
+    def shed_seconds(self, eq: Equipment) -> float:
+        """Cumul délesté d'un équipement, délestage en cours compris (s)."""
+        total = self.shed_time.get(eq.entity_id, 0.0)
+        since = self._shed_since.get(eq.entity_id)
+        if since is not None:
+            total += self.backend.monotonic() - since
+        return total
+
+    def _update_cache(self, entity_id: str, new_state):
+        """Met à jour le cache pour une entité suivie et marque ses vues sales."""
+        if entity_id == self.charger_sensor:
+            self._charger_draw = _to_power(new_state)
+        if entity_id == self.tariff_entity:
+            tariff = None
+            if new_state and new_state.state not in ("unavailable", "unknown", None):
+                tariff = str(new_state.state).lower()
+            if tariff != self.tariff:
+                self.tariff = tariff
+                self._apply_schedule(request=True)
+        for i in self._watch.get(entity_id, ()):
+            eq = self.table[i]
+            if entity_id == eq.entity_id:
+                self._status[i] = new_state.state if new_state else "inconnu"
+                if eq.modulating and not self._reduction[i] and new_state:
+                    # Réglage de l'utilisateur, mémorisé tant qu'on ne l'a pas réduit
+                    base = _user_level(eq, new_state)
+                    if base is not None:
+                        self._base_setpoint[i] = base
+            if entity_id == eq.power_sensor:
+                value = _to_power(new_state)
+                self._sensor_power[i] = value
+                if value:
+                    self._running_power[i] = value
+            self._dirty.add(i)
+
+    def _is_running(self, eq: Equipment) -> bool:
+        return self._status[eq.index] not in ("off", "unavailable", "unknown", "inconnu")
+
+    def _expected_power(self, eq: Equipment) -> float:
+        """Puissance attendue au rallumage (fixe, ou dernière mesure en marche)."""
+        if eq.power_sensor:
+            return self._running_power[eq.index]
+        if eq.power_mode == "sensor":
+            return 0.0
+        return eq.fixed_power
+
+    def _get_device_power(self, eq: Equipment) -> float:
+        """Puissance réelle d'un équipement (depuis le cache)."""
+        if eq.power_sensor:
+            value = self._sensor_power[eq.index]
+            return value if value is not None else 0.0
+        if eq.power_mode == "sensor":
+            return 0.0
+
+        # Puissance fixe — retourne 0 si l'équipement est éteint
+        if not self._is_running(eq):
+            return 0.0
+        return max(0.0, eq.fixed_power - self.reduction_power(eq))
+
+    def _known_power(self, eq: Equipment):
+        """Puissance d'un équipement en marche ; None si elle est inconnue.
+
+        Inconnue : capteur sans valeur, mode capteur sans capteur, ou
+        puissance fixe non renseignée. Un capteur à 0 W est une mesure.
+        """
+        if eq.power_sensor:
+            return self._sensor_power[eq.index]
+        if eq.power_mode == "sensor" or eq.fixed_power <= 0:
+            return None
+        return max(0.0, eq.fixed_power - self.reduction_power(eq))
+
+    def reduction_power(self, eq: Equipment) -> float:
+        """Puissance retirée par modulation sur un équipement (W)."""
+        return self._reduction[eq.index] * eq.unit_power
+
+    def throttled_power(self) -> float:
+        return sum(self.reduction_power(eq) for eq in self._modulating)
+
+    # ──────────────────────────────────────────────────────────────
+    # Logique de délestage
+    # ──────────────────────────────────────────────────────────────
+
+    async def _delestage_logic(self, current_power: float):
+        """Décision : délester ou réarmer."""
+        _LOGGER.debug(
+            "Puissance: %.0f W / seuil: %.0f W / état: %s | Délestage activé: %s",
+            current_power, self.max_power, self.state, self.enable_shedding
+        )
+
+        if not self.enable_shedding:
+            # Si le délestage est désactivé, on ne coupe rien et on réarme tout si besoin
+            if self.devices_shed:
+                _LOGGER.info("Délestage désactivé : réarmement de tous les équipements si besoin.")
+                self._record(current_power, "recover_all", reason="disabled")
+                await self._recover_devices(current_power, check_headroom=False)
+            await self._release(math.inf, current_power)
+            await self._steer_charger(None, current_power)
+            self.state = STATE_IDLE
+            self._cancel_recovery_timer()
+            return
+
+        # ── Borne de recharge : limite de courant suivie en continu ──
+        # Les équipements délestés gardent la priorité sur la marge rendue
+        reserved = sum(
+            self._expected_power(self._by_entity[e])
+            for e in self.devices_shed if e in self._by_entity
+        )
+        current_power -= await self._steer_charger(
+            self.max_power - current_power - reserved, current_power
+        )
+
+        # ── Délestage nécessaire ───────────────────────────────
+        if current_power > self.max_power:
+            reason = self._shed_reason(current_power)
+            if reason is None:
+                # Surcharge tolérée : ni coupure ni réarmement avant épuisement
+                self._arm_overload_timer(current_power)
+                return
+            self._cancel_overload_timer()
+
+            # Modulation d'abord : on ne retire que le dépassement
+            current_power -= await self._throttle(current_power - self.max_power, current_power)
+            if current_power <= self.max_power:
+                return
+
+            if self.state == STATE_RECOVERING:
+                self._cancel_recovery_timer()
+                self.state = STATE_SHEDDING
+                self._record(current_power, "recovery_cancel", reason=reason)
+
+            await self._shed_devices(current_power, reason)
+            return
+
+        self._cancel_overload_timer()
+
+        # ── Tendance : dépassement prévu dans l'horizon ───────
+        if await self._preempt_shed(current_power):
+            return
+
+        # ── Marge disponible : rendue d'abord aux charges modulées ──
+        headroom = self.max_power - self.rearm_margin - current_power
+        if await self._release(headroom, current_power):
+            return
+
+        # ── En dessous du seuil → échéance de réarmement ──────
+        if self.state == STATE_SHEDDING and self.devices_shed:
+            threshold = self.max_power - self.rearm_margin
+            if current_power <= threshold and self._recovery_deadline is None:
+                self._start_recovery_timer()
+                self.state = STATE_RECOVERING
+                self._record(current_power, "recovery_timer", reason="below_threshold")
+                _LOGGER.info(
+                    "Délai de réarmement démarré (%.0f s)", self.recovery_delay
+                )
+
+        # ── Récupération en cours : échéance atteinte ? ───────
+        elif self.state == STATE_RECOVERING:
+            if self._recovery_elapsed():
+                await self._recover_devices(current_power)
+
+        # ── Idle propre ───────────────────────────────────────
+        elif not self.devices_shed:
+            self.state = STATE_IDLE
+            self._cancel_recovery_timer()
+
+    # ──────────────────────────────────────────────────────────────
+    # Seuils planifiés (HP/HC, Tempo)
+    # ──────────────────────────────────────────────────────────────
+
+    def _configure_schedule(self, cfg: dict):
+        """Compile le planning une fois ; le seuil fixe sert hors plage."""
+        self.base_max_power = self.max_power
+        self.tariff_entity = cfg.get(CONF_TARIFF_ENTITY) or None
+        try:
+            self.schedule = parse_schedule(cfg.get(CONF_SCHEDULE, ""))
+        except ValueError as err:
+            _LOGGER.warning("Planning de seuils ignoré : %s", err)
+            self.schedule = None
+        if not self.tariff_entity:
+            self.tariff = None
+        self._apply_schedule()
+
+    def _apply_schedule(self, request: bool = False):
+        """Seuil de la plage courante (lecture O(1)) et minuterie sur la suivante."""
+        self._cancel_schedule_timer()
+        if self.schedule is None:
+            self.max_power = self.base_max_power
+            return
+        now = self.backend.now()
+        minute = now.hour * 60 + now.minute
+        previous = self.max_power
+        limit = self.schedule.limit(self.tariff, minute)
+        self.max_power = self.base_max_power if limit is None else limit
+
+        wait = self.schedule.next_change(self.tariff, minute)
+        if wait is not None:
+            boundary = now.replace(second=0, microsecond=0) + timedelta(minutes=wait)
+            # Écart réel (UTC) : une plage qui enjambe un changement d'heure reste juste
+            delay = (
+                boundary.astimezone(timezone.utc) - now.astimezone(timezone.utc)
+            ).total_seconds()
+            self.next_threshold_at = boundary
+            self._unsub_schedule = self.backend.call_later(
+                max(delay, 1.0), self._schedule_due
+            )
+
+        if request and self.max_power != previous:
+            _LOGGER.info(
+                "Seuil planifié : %.0f W → %.0f W (tarif %s)",
+                previous, self.max_power, self.tariff or "-",
+            )
+            self._record(self._last_sample, "threshold", reason=self.tariff)
+            self._request_decision()
+
+    def _cancel_schedule_timer(self):
+        if self._unsub_schedule:
+            self._unsub_schedule()
+            self._unsub_schedule = None
+        self.next_threshold_at = None
+
+    def _schedule_due(self):
+        """Frontière de plage atteinte : nouveau seuil et décision immédiate."""
+        self._unsub_schedule = None
+        self._apply_schedule(request=True)
+
+    # ──────────────────────────────────────────────────────────────
+    # Budget de la borne de recharge
+    # ──────────────────────────────────────────────────────────────
+
+    def _configure_charger(self, cfg: dict):
+        self.charger_entity = cfg.get(CONF_CHARGER_ENTITY) or None
+        self.charger_sensor = cfg.get(CONF_CHARGER_SENSOR) or None
+        self.charger_unit_power = float(
+            cfg.get(CONF_CHARGER_UNIT_POWER) or DEFAULT_CHARGER_UNIT_POWER
+        )
+        self.charger_min_current = float(
+            cfg.get(CONF_CHARGER_MIN_CURRENT, DEFAULT_CHARGER_MIN_CURRENT)
+        )
+        self.charger_max_current = max(self.charger_min_current, float(
+            cfg.get(CONF_CHARGER_MAX_CURRENT, DEFAULT_CHARGER_MAX_CURRENT)
+        ))
+        self.charger_hysteresis = float(
+            cfg.get(CONF_CHARGER_HYSTERESIS, DEFAULT_CHARGER_HYSTERESIS)
+        )
+        self.charger_interval = float(
+            cfg.get(CONF_CHARGER_INTERVAL, DEFAULT_CHARGER_INTERVAL)
+        )
+        # Limite republiée au premier échantillon après un rechargement
+        self._charger_limit = None
+        self._charger_draw = None
+        self.charger_budget = None
+
+    def charger_draw(self) -> float:
+        """Puissance tirée par la borne : mesurée, sinon supposée à la limite."""
+        if self.charger_sensor:
+            return self._charger_draw or 0.0
+        return (self._charger_limit or 0.0) * self.charger_unit_power
+
+    async def _steer_charger(self, headroom, current_power: float) -> float:
+        """Publie ``max_power − puissance + tirage de la borne`` en ampères.
+
+        Baisse immédiate dès que la limite en cours dépasse le budget ;
+        hausse seulement jusqu'au budget moins l'hystérésis (A), et au plus
+        une fois par ``charger_interval`` : une limite relevée reste d'autant
+        sous le budget et ne rebaisse pas au moindre creux. ``headroom``
+        None : limite maximale (délestage désactivé). Retourne les W retirés
+        par une baisse, 0 sinon.
+        """
+        if not self.charger_entity:
+            return 0.0
+        draw = self.charger_draw()
+        last = self._charger_limit
+        if headroom is None:
+            target = self.charger_max_current
+        else:
+            self.charger_budget = headroom + draw
+            target = float(math.floor(self.charger_budget / self.charger_unit_power + 1e-9))
+            # Sous le minimum, la borne reste au plus bas : le délestage fait le reste
+            target = min(self.charger_max_current, max(self.charger_min_current, target))
+            if last is not None and target > last:
+                margin = float(math.floor(
+                    self.charger_budget / self.charger_unit_power
+                    - self.charger_hysteresis + 1e-9
+                ))
+                target = max(last, min(target, margin))
+
+        now = self.backend.monotonic()
+        if last is not None:
+            if target == last:
+                return 0.0
+            if (target > last and self._charger_raised_at is not None
+                    and now - self._charger_raised_at < self.charger_interval):
+                return 0.0
+
+        start = now
+        ok = await self._call_service(self.charger_entity, "set_value", {"value": target})
+        self._record(
+            current_power, "charger_limit", self.charger_entity,
+            "raise" if last is None or target > last else "lower",
+            self.backend.monotonic() - start, bool(ok),
+        )
+        if not ok:
+            return 0.0
+        self._charger_limit = target
+        if last is None or target > last:
+            self._charger_raised_at = self.backend.monotonic()
+        removed = max(0.0, draw - target * self.charger_unit_power)
+        if removed and self._reaction_pending and current_power > self.max_power:
+            self._reaction_pending = False
+            self.reaction_latency.record(self.backend.monotonic() - self._over_since)
+        return removed
+
+    # ──────────────────────────────────────────────────────────────
+    # Charges modulables
+    # ──────────────────────────────────────────────────────────────
+
+    async def _throttle(self, overshoot: float, current_power: float) -> float:
+        """Réduit les charges modulables par priorité ; retourne les W retirés."""
+        removed = 0.0
+        for eq in self._modulating:
+            if removed >= overshoot:
+                break
+            i = eq.index
+            spare = self._spare_units(eq)
+            if spare <= 0 or eq.unit_power <= 0 or not self._is_running(eq):
+                continue
+            units = min(spare, _ceil_step((overshoot - removed) / eq.unit_power, eq.step))
+            if await self._set_level(eq, self._reduction[i] + units, current_power, "throttle"):
+                removed += units * eq.unit_power
+        return removed
+
+    def _spare_units(self, eq: Equipment) -> float:
+        """Unités encore réductibles sous le réglage de base (0 s'il est inconnu)."""
+        i = eq.index
+        base = self._base_setpoint[i]
+        if base is None:
+            return 0.0
+        if eq.control == CONTROL_CLIMATE:
+            # Abaissement borné par la plage, quelle que soit la consigne
+            return eq.max_level - eq.min_level - self._reduction[i]
+        return base - eq.min_level - self._reduction[i]
+
+    async def _release(self, headroom: float, current_power: float) -> bool:
+        """Rend la marge aux charges modulées, les plus prioritaires d'abord."""
+        released = False
+        for eq in reversed(self._modulating):
+            i = eq.index
+            # Charge arrêtée : on ne la rallume pas, sa base sera rendue à la reprise
+            if not self._reduction[i] or not self._is_running(eq):
+                continue
+            if headroom == math.inf:
+                units = self._reduction[i]
+            else:
+                units = min(self._reduction[i], _floor_step(headroom / eq.unit_power, eq.step))
+            if units <= 0:
+                continue
+            if await self._set_level(eq, self._reduction[i] - units, current_power, "release"):
+                headroom -= units * eq.unit_power
+                released = True
+        return released
+
+    async def _set_level(self, eq: Equipment, reduction: float, power, reason: str) -> bool:
+        """Applique une réduction (unités) sous le réglage de base de l'utilisateur."""
+        i = eq.index
+        base = self._base_setpoint[i]
+        if base is None:
+            return False
+        if eq.control == CONTROL_CLIMATE:
+            service, data = "set_temperature", {"temperature": base - reduction}
+        elif eq.control == CONTROL_BRIGHTNESS:
+            service, data = "turn_on", {"brightness_pct": base - reduction}
+        else:
+            service, data = "set_value", {"value": base - reduction}
+
+        # Posée avant l'appel : l'état publié pendant l'appel ne devient pas la base
+        previous, self._reduction[i] = self._reduction[i], reduction
+        start = self.backend.monotonic()
+        ok = await self._call_service(eq.entity_id, service, data)
+        self._record(
+            power, "set_level", eq.entity_id, reason, self.backend.monotonic() - start, bool(ok)
+        )
+        if not ok:
+            self._reduction[i] = previous
+        else:
+            self._level_version += 1
+            self._dirty.add(i)
+            if reason == "throttle" and self._reaction_pending:
+                self._reaction_pending = False
+                self.reaction_latency.record(self.backend.monotonic() - self._over_since)
+        return ok
+
+    # ──────────────────────────────────────────────────────────────
+    # Délestage
+    # ──────────────────────────────────────────────────────────────
+
+    async def _shed_devices(self, current_power: float, reason: str = "overload"):
+        """Coupe en une passe le lot planifié pour repasser sous le seuil."""
+        for _ in range(len(self.table)):
+            batch = self._plan_shed(current_power)
+            if not batch or not await self._dispatch_shed(batch, current_power, reason):
+                break
+            # Décision suivante uniquement sur un échantillon postérieur à la coupure
+            fresh = await self.async_wait_next_sample()
+            if fresh is None or fresh <= self.max_power:
+                break
+            current_power = fresh
+
+        self.state = STATE_SHEDDING
+        self.last_shed_time = self.backend.now()
+
+    def _plan_shed(self, current_power: float) -> list:
+        """Lot minimal, par ordre de priorité, couvrant le dépassement.
+
+        Les candidats sortent du tas par priorité puis, à priorité égale, du
+        moins délesté au plus délesté (cumul, puis ancienneté du dernier
+        délestage) : la coupure tourne entre équipements équivalents. Les
+        puissances connues (fixe ou capteur) sont sommées jusqu'à couvrir
+        ``current_power - max_power`` ; les équipements de plus haute priorité
+        devenus superflus sont ensuite retirés du lot. Un équipement à
+        puissance inconnue clôt le lot : le prochain échantillon dira s'il
+        faut continuer (comportement itératif historique). Un équipement
+        mesuré à 0 W est ignoré : il ne soulagerait rien.
+        """
+        overshoot = current_power - self.max_power
+        if overshoot <= 0:
+            return []
+
+        covered = 0.0
+        batch = []
+        powers = []
+        popped = []
+        unknown = False
+        heap = self._shed_heap
+
+        while heap:
+            entry = heapq.heappop(heap)
+            eq = self.table[entry[3]]
+            if entry[4] != self._heap_version[eq.index]:
+                continue  # délesté depuis : entrée périmée, abandonnée
+            popped.append(entry)
+            if not self._is_running(eq):
+                continue
+
+            power = self._known_power(eq)
+            if power is not None and power <= 0:
+                continue  # mesuré à 0 W : le couper ne soulage rien
+            batch.append(eq)
+            powers.append(power)
+            if power is None:
+                unknown = True
+                break
+            covered += power
+            if covered >= overshoot:
+                break
+
+        # Les candidats lus retournent au tas ; ceux délestés seront périmés
+        for entry in popped:
+            heapq.heappush(heap, entry)
+        if unknown:
+            return batch
+
+        # Minimalité : on rend la main aux plus prioritaires devenus inutiles
+        if covered >= overshoot:
+            for i in range(len(batch) - 2, -1, -1):
+                if covered - powers[i] >= overshoot:
+                    covered -= powers[i]
+                    del batch[i]
+                    del powers[i]
+
+        return batch
+
+    async def _dispatch_shed(
+        self, batch: list, current_power: float, reason: str = "overload"
+    ) -> int:
+        """Coupe le lot (en parallèle si activé) ; retourne le nombre délesté."""
+        limit = self.shed_concurrency if self.parallel_shed else 1
+        sem = asyncio.Semaphore(limit)
+        start = self.backend.monotonic()
+
+        async def _cut(eq: Equipment) -> bool:
+            async with sem:
+                return await self._turn_off(eq.entity_id, current_power, reason)
+
+        results = await asyncio.gather(
+            *(_cut(eq) for eq in batch), return_exceptions=True
+        )
+        # Temps de soulagement : jusqu'à confirmation de l'équipement le plus lent
+        self.last_relief_time = round(self.backend.monotonic() - start, 3)
+
+        shed = 0
+        for eq, res in zip(batch, results):
+            if res is None:
+                continue  # service en échec, déjà journalisé : rien n'a été coupé
+            if isinstance(res, Exception):
+                _LOGGER.error("Échec du délestage de %s : %s", eq.entity_id, res)
+                self._record(current_power, "turn_off", eq.entity_id, "error", ok=False)
+                continue
+            # Même en cas de timeout l'ordre est parti : on le considère délesté
+            self._mark_shed(eq)
+            shed += 1
+            _LOGGER.info(
+                "Délestage : %s (priorité %s) — %.0f W",
+                eq.entity_id, eq.priority, current_power,
+            )
+
+        _LOGGER.debug(
+            "Délestage : %d équipement(s) en un lot, soulagement en %.3f s",
+            len(batch), self.last_relief_time,
+        )
+        return shed
+
+    # ──────────────────────────────────────────────────────────────
+    # Réarmement
+    # ──────────────────────────────────────────────────────────────
+
+    async def _recover_devices(self, current_power: float, check_headroom: bool = True):
+        """Rallume les équipements dans l'ordre inverse de priorité.
+
+        Avant chaque turn_on, la marge ``max_power - rearm_margin - puissance``
+        doit couvrir la puissance attendue de l'équipement ; sinon le
+        réarmement s'arrête et reprend après un nouveau délai. Chaque
+        rallumage est suivi de la fenêtre d'appel de courant de l'équipement
+        (écourtée par le premier échantillon en surcharge) avant de juger la
+        mesure et de passer au suivant.
+        """
+        recovered = []
+
+        for entity_id in sorted(self.devices_shed, key=self._recovery_rank):
+            eq = self._by_entity.get(entity_id)
+            if check_headroom and eq is not None:
+                headroom = self.max_power - self.rearm_margin - current_power
+                needed = self._expected_power(eq)
+                if needed > headroom:
+                    self._record(current_power, "recovery_deferred", entity_id, "headroom")
+                    _LOGGER.info(
+                        "Réarmement différé pour %s : %.0f W attendus, marge %.0f W",
+                        entity_id, needed, headroom,
+                    )
+                    break
+
+            started = self.backend.monotonic()
+            if await self._turn_on(entity_id, current_power, "recovery") is None:
+                continue  # service en échec : reste délesté, nouvel essai au prochain cycle
+
+            # On attend que le compteur reflète la charge rallumée
+            fresh = await self.async_wait_next_sample()
+            if fresh is None:
+                recovered.append(entity_id)
+                _LOGGER.debug(
+                    "Réarmement de %s sans nouvel échantillon : suite au prochain cycle",
+                    entity_id,
+                )
+                break
+
+            # Appel de courant : on juge la mesure la plus récente après la fenêtre
+            window = eq.inrush_delay if eq is not None else 0.0
+            remaining = window - (self.backend.monotonic() - started)
+            if remaining > 0:
+                fresh = await self._watch_inrush(remaining, fresh)
+            current_power = fresh
+
+            if current_power > self.max_power:
+                await self._turn_off(entity_id, current_power, "recovery_overload")
+                _LOGGER.warning(
+                    "Réarmement annulé pour %s : %.0f W > seuil %.0f W",
+                    entity_id, current_power, self.max_power
+                )
+                break
+
+            recovered.append(entity_id)
+            _LOGGER.info("Réarmement OK : %s", entity_id)
+
+        self._mark_recovered(recovered)
+        self.last_recovery_time = self.backend.now()
+        self._cancel_recovery_timer()
+        # Marge insuffisante : pas d'aller-retour ; la nouvelle échéance part
+        # du prochain échantillon sous le seuil, jamais d'une relance immédiate
+        self.state = STATE_IDLE if not self.devices_shed else STATE_SHEDDING
+
+    def _recovery_rank(self, entity_id: str):
+        """Plus prioritaire d'abord ; à priorité égale, le plus anciennement coupé."""
+        eq = self._by_entity.get(entity_id)
+        priority = eq.priority if eq is not None else 0
+        return (-priority, self._shed_since.get(entity_id, math.inf))
+
+    # ──────────────────────────────────────────────────────────────
+    # Helpers turn_on / turn_off
+    # ──────────────────────────────────────────────────────────────
+
+    def _domain(self, entity_id: str) -> str:
+        eq = self._by_entity.get(entity_id)
+        return eq.domain if eq else entity_id.split(".", 1)[0]
+
+    async def _call_service(
+        self, entity_id: str, service: str, data: dict | None = None
+    ) -> bool | None:
+        """Appel bloquant borné par shed_timeout.
+
+        True si confirmé, False si le délai expire (l'ordre est parti), None
+        si le service échoue : l'erreur est journalisée, jamais propagée, pour
+        qu'un actionneur défaillant n'interrompe pas la décision en cours.
+        """
+        domain = self._domain(entity_id)
+        start = self.backend.monotonic()
+        try:
+            await self.backend.wait_for(
+                self.backend.call_service(domain, service, entity_id, data),
+                self.shed_timeout,
+            )
+        except asyncio.TimeoutError:
+            _LOGGER.warning(
+                "[Délestage] %s.%s sans réponse après %.1f s pour %s",
+                domain, service, self.shed_timeout, entity_id,
+            )
+            return False
+        except Exception as err:  # intégration hors ligne, service absent…
+            _LOGGER.error(
+                "[Délestage] Échec de %s.%s pour %s : %s", domain, service, entity_id, err
+            )
+            return None
+        finally:
+            self._restart_trend()
+            if entity_id in self._by_entity:
+                hist = self.service_latency.get(entity_id)
+                if hist is None:
+                    hist = self.service_latency[entity_id] = LatencyHistogram()
+                hist.record(self.backend.monotonic() - start)
+        return True
+
+    async def _turn_off(self, entity_id: str, power=None, reason=None) -> bool | None:
+        _LOGGER.debug("[Délestage] Désactivation demandée pour %s", entity_id)
+        start = self.backend.monotonic()
+        ok = await self._call_service(entity_id, "turn_off")
+        self._record(
+            power, "turn_off", entity_id, reason, self.backend.monotonic() - start, bool(ok)
+        )
+        if ok and self._reaction_pending:
+            # Première coupure confirmée depuis le franchissement du seuil
+            self._reaction_pending = False
+            self.reaction_latency.record(self.backend.monotonic() - self._over_since)
+        return ok
+
+    async def _turn_on(self, entity_id: str, power=None, reason=None) -> bool | None:
+        _LOGGER.debug("[Délestage] Activation demandée pour %s", entity_id)
+        start = self.backend.monotonic()
+        ok = await self._call_service(entity_id, "turn_on")
+        self._record(
+            power, "turn_on", entity_id, reason, self.backend.monotonic() - start, bool(ok)
+        )
+        return ok
+
+
+def _to_power(new_state):
+    """Valeur numérique d'un état de capteur (None si indisponible)."""
+    if new_state and new_state.state not in ("unavailable", "unknown", None):
+        try:
+            return float(new_state.state)
+        except (ValueError, TypeError):
+            pass
+    return None
+
+
+def _user_level(eq: Equipment, state):
+    """Niveau réglé lu sur l'état : consigne °C, luminosité % ou valeur."""
+    attributes = getattr(state, "attributes", {})
+    if eq.control == CONTROL_CLIMATE:
+        return attributes.get("temperature")
+    if eq.control == CONTROL_BRIGHTNESS:
+        brightness = attributes.get("brightness")
+        return None if brightness is None else round(brightness * 100 / 255)
+    try:
+        return float(state.state)
+    except (TypeError, ValueError):
+        return None
+
+
+def _ceil_step(value: float, step: float) -> float:
+    return math.ceil(value / step - 1e-9) * step
+
+
+def _floor_step(value: float, step: float) -> float:
+    return math.floor(value / step + 1e-9) * step
@@ -1,10 +1,11 @@
 """Toutes les entités de l'intégration Délestage."""
 import logging
+from homeassistant.core import callback
 from homeassistant.components.sensor import SensorEntity, SensorStateClass, SensorDeviceClass
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.device_registry import DeviceEntryType
-from homeassistant.const import UnitOfPower, PERCENTAGE
+from homeassistant.const import EntityCategory, UnitOfPower, UnitOfTime, PERCENTAGE
 from .const import *
 
 _LOGGER = logging.getLogger(__name__)
@@ -29,6 +30,8 @@ class DelestageSensor(CoordinatorEntity, SensorEntity):
 
     _attr_has_entity_name = False
     _attr_icon = "mdi:lightning-bolt"
+    # Attributs volumineux : visibles dans l'état, jamais écrits par le recorder
+    _unrecorded_attributes = frozenset({ATTR_DEVICES_SHED, ATTR_ALL_DEVICES})
 
     def __init__(self, coordinator, entry):
         super().__init__(coordinator)
@@ -56,9 +59,17 @@ class DelestageSensor(CoordinatorEntity, SensorEntity):
             "devices_shed":       data.get("devices_shed", []),
             "devices_shed_count": data.get("devices_shed_count", 0),
             "total_power_shed":   data.get("total_power_shed", 0),
-            "recovery_countdown": data.get("recovery_countdown"),
+            "total_power_throttled": data.get("total_power_throttled", 0),
+            "tariff":             data.get("tariff"),
+            "next_threshold_at":  data.get("next_threshold_at"),
+            "charger_limit":      data.get("charger_limit"),
+            "charger_budget":     data.get("charger_budget"),
+            "recovery_at":        data.get("recovery_at"),
             "last_shed_time":     data.get("last_shed_time"),
             "last_recovery_time": data.get("last_recovery_time"),
+            "overload_percent":   data.get("overload_percent"),
+            "sensor_stale":       data.get("sensor_stale", False),
+            "startup_time_ms":    data.get("startup_time_ms"),
             "all_devices":        data.get("all_devices", []),
         }
 
@@ -73,30 +84,45 @@ class DelestageEquipmentSensor(CoordinatorEntity, SensorEntity):
     _attr_has_entity_name = False
     _attr_icon = "mdi:power-plug"
 
-    def __init__(self, coordinator, entry, eq: dict):
+    def __init__(self, coordinator, entry, eq):
         super().__init__(coordinator)
         self._entry = entry
         self._eq = eq
-        name = eq.get(CONF_DEVICE_NAME, eq.get(CONF_DEVICE_ENTITY, "?"))
-        uid  = eq.get(CONF_DEVICE_ENTITY, name).replace(".", "_")
+        self._view = None
+        name = eq.raw.get(CONF_DEVICE_NAME, eq.entity_id or "?")
+        uid  = (eq.entity_id or name).replace(".", "_")
         self._attr_name       = name
         self._attr_unique_id  = f"{DOMAIN}_equip_{uid}"
         self._attr_device_info = _device_info(entry)
 
+    async def async_added_to_hass(self) -> None:
+        self._view = self.coordinator.device_view(self._eq)
+        await super().async_added_to_hass()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        # La vue n'est recréée par le coordinateur que si statut, puissance
+        # ou délestage ont changé : l'identité suffit à filtrer les écritures
+        view = self.coordinator.device_view(self._eq)
+        if view is self._view:
+            return
+        self._view = view
+        self.async_write_ha_state()
+
     @property
     def native_value(self):
-        entity_id = self._eq.get(CONF_DEVICE_ENTITY, "")
-        s = self.hass.states.get(entity_id)
-        return s.state if s else "inconnu"
+        return self._view["status"] if self._view else "inconnu"
 
     @property
     def extra_state_attributes(self):
-        entity_id = self._eq.get(CONF_DEVICE_ENTITY, "")
+        view = self._view or {}
         return {
-            "priority":  int(float(self._eq.get(CONF_DEVICE_PRIORITY, 99))),
-            "power":     self.coordinator._get_device_power(self._eq),
-            "shed":      entity_id in self.coordinator.devices_shed,
-            "entity_id": entity_id,
+            "priority":  self._eq.priority,
+            "power":     view.get("power", 0.0),
+            "shed":      view.get("shed", False),
+            "reduction": view.get("reduction", 0.0),
+            "shed_time_s": view.get("shed_time", 0),
+            "entity_id": self._eq.entity_id,
         }
 
 
@@ -218,11 +244,11 @@ class DelestageShedPowerSensor(CoordinatorEntity, SensorEntity):
 # ══════════════════════════════════════════════════════════════════
 
 class DelestageCountdownSensor(CoordinatorEntity, SensorEntity):
-    """Secondes avant réarmement."""
+    """Échéance du réarmement (horodatage : le frontend affiche le décompte)."""
 
     _attr_has_entity_name = False
     _attr_icon            = "mdi:timer-outline"
-    _attr_state_class     = SensorStateClass.MEASUREMENT
+    _attr_device_class    = SensorDeviceClass.TIMESTAMP
 
     def __init__(self, coordinator, entry):
         super().__init__(coordinator)
@@ -233,7 +259,123 @@ class DelestageCountdownSensor(CoordinatorEntity, SensorEntity):
 
     @property
     def native_value(self):
-        data = self.coordinator.data
-        if data:
-            return data.get("recovery_countdown")
-        return self.coordinator._get_recovery_countdown()
+        # L'échéance ne change qu'à l'armement ou à l'annulation : publiée dans data
+        return self.coordinator._recovery_at
+
+
+# ══════════════════════════════════════════════════════════════════
+# Sensors de diagnostic : latences de réaction
+# ══════════════════════════════════════════════════════════════════
+
+class _DelestageLatencySensor(CoordinatorEntity, SensorEntity):
+    """Dernière mesure d'un histogramme de latence ; percentiles en attributs.
+
+    Lu à chaque publication du coordinateur : aucune écriture supplémentaire.
+    """
+
+    _attr_has_entity_name  = False
+    _attr_entity_category  = EntityCategory.DIAGNOSTIC
+    _attr_device_class     = SensorDeviceClass.DURATION
+    _attr_state_class      = SensorStateClass.MEASUREMENT
+    _attr_native_unit_of_measurement = UnitOfTime.MILLISECONDS
+    _attr_icon             = "mdi:timer-sand"
+    _metric = ""
+    _label = ""
+
+    def __init__(self, coordinator, entry):
+        super().__init__(coordinator)
+        self._entry = entry
+        self._attr_name      = self._label
+        self._attr_unique_id = f"{DOMAIN}_latency_{self._metric}"
+        self._attr_device_info = _device_info(entry)
+
+    def _histogram(self):
+        return getattr(self.coordinator, self._metric)
+
+    @property
+    def native_value(self):
+        return self._histogram().summary()["last_ms"]
+
+    @property
+    def extra_state_attributes(self):
+        return self._histogram().summary()
+
+
+class DelestageReactionSensor(_DelestageLatencySensor):
+    """Franchissement du seuil → première coupure confirmée."""
+
+    _metric = "reaction_latency"
+    _label = "Temps de reaction"
+
+
+class DelestageOverloadDurationSensor(_DelestageLatencySensor):
+    """Durée passée au-dessus de max_power par dépassement."""
+
+    _metric = "overload_duration"
+    _label = "Duree de depassement"
+
+
+class DelestageDecisionTimeSensor(_DelestageLatencySensor):
+    """Durée d'une décision de l'acteur (attente du compteur comprise)."""
+
+    _metric = "decision_latency"
+    _label = "Temps de decision"
+
+
+class DelestageServiceLatencySensor(_DelestageLatencySensor):
+    """Latence des appels turn_on/turn_off, détaillée par équipement."""
+
+    _metric = "service_latency"
+    _label = "Latence des commandes"
+    _unrecorded_attributes = frozenset({"devices"})
+
+    @property
+    def native_value(self):
+        latest = [
+            h.last for h in self.coordinator.service_latency.values()
+            if h.last is not None
+        ]
+        return round(max(latest), 1) if latest else None
+
+    @property
+    def extra_state_attributes(self):
+        return {
+            "devices": {
+                entity_id: {
+                    "count":   h.count,
+                    "last_ms": round(h.last, 1) if h.last is not None else None,
+                    "p95_ms":  h.percentile(95),
+                    "max_ms":  round(h.max, 1),
+                }
+                for entity_id, h in self.coordinator.service_latency.items()
+            }
+        }
+
+
+# ══════════════════════════════════════════════════════════════════
+# Sensor de diagnostic : précision du délestage prédictif
+# ══════════════════════════════════════════════════════════════════
+
+class DelestagePredictionSensor(CoordinatorEntity, SensorEntity):
+    """Part des prédictions confirmées (la charge coupée aurait fait dépasser)."""
+
+    _attr_has_entity_name = False
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_state_class     = SensorStateClass.MEASUREMENT
+    _attr_native_unit_of_measurement = PERCENTAGE
+    _attr_icon            = "mdi:chart-timeline-variant"
+
+    def __init__(self, coordinator, entry):
+        super().__init__(coordinator)
+        self._entry = entry
+        self._attr_name      = "Precision de prediction"
+        self._attr_unique_id = f"{DOMAIN}_prediction_precision"
+        self._attr_device_info = _device_info(entry)
+
+    @property
+    def native_value(self):
+        return self.coordinator.prediction_metrics()["precision"]
+
+    @property
+    def extra_state_attributes(self):
+        return self.coordinator.prediction_metrics()
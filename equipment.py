@@ -0,0 +1,95 @@
+"""Table compilée des équipements pilotés par le délestage."""
+from .const import *
+
+
+class Equipment:
+    """Équipement pré-analysé une seule fois au chargement de la config."""
+
+    __slots__ = (
+        "index",
+        "name",
+        "entity_id",
+        "domain",
+        "priority",
+        "power_mode",
+        "fixed_power",
+        "power_sensor",
+        "inrush_delay",
+        "control",
+        "min_level",
+        "max_level",
+        "unit_power",
+        "step",
+        "raw",
+    )
+
+    def __init__(self, index: int, eq: dict):
+        entity_id = eq.get(CONF_DEVICE_ENTITY, "") or ""
+        self.index        = index
+        self.raw          = eq
+        self.entity_id    = entity_id
+        self.name         = eq.get(CONF_DEVICE_NAME) or entity_id
+        self.domain       = entity_id.split(".", 1)[0]
+        self.priority     = _to_int(eq.get(CONF_DEVICE_PRIORITY, 99), 99)
+        self.power_mode   = eq.get(CONF_DEVICE_POWER_MODE, "fixed")
+        self.fixed_power  = _to_float(eq.get(CONF_DEVICE_FIXED_PWR, 0), 0.0)
+        self.power_sensor = (eq.get(CONF_DEVICE_PWR_SENSOR) or "") \
+            if self.power_mode == "sensor" else ""
+        self.inrush_delay = max(0.0, _to_float(
+            eq.get(CONF_DEVICE_INRUSH, DEFAULT_INRUSH_DELAY), DEFAULT_INRUSH_DELAY
+        ))
+        self.control      = eq.get(CONF_DEVICE_CONTROL) or CONTROL_TOGGLE
+        # Pilotage inconnu ou sans service sur ce domaine : tout ou rien
+        if self.domain not in CONTROL_DOMAINS.get(self.control, ()):
+            self.control = CONTROL_TOGGLE
+        self._compile_levels(eq)
+
+    @property
+    def modulating(self) -> bool:
+        return self.control != CONTROL_TOGGLE
+
+    def _compile_levels(self, eq: dict):
+        """Plage de modulation : niveaux, pas et W par unité selon le pilotage.
+
+        ``number`` : niveau = consigne (ex. A), 230 W/A par défaut ;
+        ``brightness`` : 0–100 %, puissance fixe / 100 par unité ;
+        ``climate_offset`` : abaissement 0–3 °C par pas de 0,5 °C, la
+        puissance fixe étant supposée coupée à l'abaissement maximal.
+        """
+        if self.control == CONTROL_BRIGHTNESS:
+            lo, hi, step, unit = 0.0, 100.0, 1.0, self.fixed_power / 100
+        elif self.control == CONTROL_CLIMATE:
+            lo, hi, step = 0.0, 3.0, 0.5
+            unit = self.fixed_power / hi
+        else:
+            lo, hi, step, unit = 6.0, 32.0, 1.0, 230.0
+        self.min_level  = _to_float(eq.get(CONF_DEVICE_MIN_LEVEL, lo), lo)
+        self.max_level  = max(self.min_level, _to_float(eq.get(CONF_DEVICE_MAX_LEVEL, hi), hi))
+        self.step       = _to_float(eq.get(CONF_DEVICE_STEP, step), step) or step
+        self.unit_power = _to_float(eq.get(CONF_DEVICE_UNIT_POWER, unit), unit) or unit
+
+    def __repr__(self) -> str:
+        return f"<Equipment {self.entity_id} p={self.priority}>"
+
+
+def compile_equipments(equipments: list) -> list:
+    """Compile la config brute en une liste d'Equipment triée par priorité."""
+    ordered = sorted(
+        equipments,
+        key=lambda e: _to_int(e.get(CONF_DEVICE_PRIORITY, 99), 99)
+    )
+    return [Equipment(i, eq) for i, eq in enumerate(ordered)]
+
+
+def _to_int(value, default: int) -> int:
+    try:
+        return int(float(value))
+    except (ValueError, TypeError):
+        return default
+
+
+def _to_float(value, default: float) -> float:
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return default
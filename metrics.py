@@ -0,0 +1,54 @@
+"""Histogrammes de latence à taille fixe (mémoire bornée)."""
+from bisect import bisect_left
+
+# Bornes supérieures des classes, en ms (la dernière classe est ouverte)
+LATENCY_BUCKETS_MS = (
+    1, 2, 5, 10, 20, 50, 100, 200, 500,
+    1000, 2000, 5000, 10000, 30000, 60000, 300000, 600000,
+)
+
+
+class LatencyHistogram:
+    """Distribution de durées sur des classes fixes ; O(log k) par mesure."""
+
+    __slots__ = ("counts", "count", "total", "last", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.last = None
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        ms = max(0.0, seconds * 1000)
+        self.counts[bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.last = ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, pct: float):
+        """Borne supérieure de la classe contenant le percentile (ms)."""
+        if not self.count:
+            return None
+        rank = pct / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                edge = float(LATENCY_BUCKETS_MS[i]) if i < len(LATENCY_BUCKETS_MS) else self.max
+                return round(min(edge, self.max), 1)
+        return round(self.max, 1)
+
+    def summary(self) -> dict:
+        return {
+            "count":   self.count,
+            "last_ms": round(self.last, 1) if self.last is not None else None,
+            "mean_ms": round(self.total / self.count, 1) if self.count else None,
+            "p50_ms":  self.percentile(50),
+            "p95_ms":  self.percentile(95),
+            "p99_ms":  self.percentile(99),
+            "max_ms":  round(self.max, 1) if self.count else None,
+        }
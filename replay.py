@@ -0,0 +1,419 @@
+"""Rejeu hors ligne du moteur de délestage sur une trace de puissance.
+
+Usage, sans Home Assistant (le moteur n'en dépend pas)::
+
+    python delestage/replay.py trace.csv --config config.json
+
+``python -m delestage.replay`` (depuis le dossier parent) passe par
+l'``__init__`` du paquet et exige donc Home Assistant installé.
+
+La trace est un CSV ``horodatage,puissance`` (epoch ou ISO 8601) ou un
+export d'historique Home Assistant (colonnes ``entity_id,state,last_changed``).
+La config reprend data + options de l'entrée (``equipments``, ``max_power``…).
+
+Le compteur simulé vaut la trace moins la puissance des équipements que le
+moteur a coupés ; les équipements sont supposés allumés dans l'enregistrement.
+Une borne de recharge configurée y est supposée tirer son courant maximal,
+et les charges modulables être réglées à leur niveau nominal (consigne de
+``SIM_SETPOINT`` °C pour un thermostat). Les seuils planifiés sont évalués
+à l'heure locale du fuseau ``--tz`` (par défaut celui du système), comme
+Home Assistant le fait dans le sien.
+"""
+import argparse
+import asyncio
+import csv
+import heapq
+import itertools
+import json
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+if __name__ == "__main__" and not __package__:
+    # Lancé comme script : paquet synthétique, sans l'__init__ qui importe HA
+    import pathlib
+    import sys
+    import types
+
+    _here = pathlib.Path(__file__).resolve().parent
+    _pkg = types.ModuleType(_here.name)
+    _pkg.__path__ = [str(_here)]
+    sys.modules[_here.name] = _pkg
+    __package__ = _here.name
+
+from .const import *
+from .engine import Backend, DelestageEngine
+
+_LOGGER = logging.getLogger(__name__)
+
+# Consigne initiale des thermostats simulés (°C)
+SIM_SETPOINT = 20.0
+
+
+class SimState:
+    """État minimal compatible avec ``DelestageEngine._update_cache``."""
+
+    __slots__ = ("state", "attributes")
+
+    def __init__(self, state: str, attributes: dict | None = None):
+        self.state = state
+        self.attributes = attributes or {}
+
+
+class SimBackend(Backend):
+    """Horloge virtuelle : minuteries ordonnées, services instantanés."""
+
+    def __init__(self, start: datetime, tz=None):
+        self.start = start
+        self.tz = tz  # None : fuseau du système
+        self.t = 0.0
+        self._timers = []
+        self._seq = itertools.count()
+        self.engine = None
+        self.calls = {"turn_off": 0, "turn_on": 0}
+        self.off = set()
+        self.levels = {}
+
+    def monotonic(self) -> float:
+        return self.t
+
+    def now(self) -> datetime:
+        return (self.start + timedelta(seconds=self.t)).astimezone(self.tz)
+
+    def utcnow(self) -> datetime:
+        return self.now().astimezone(timezone.utc)
+
+    def call_later(self, delay: float, action):
+        timer = [self.t + max(0.0, delay), next(self._seq), action]
+        heapq.heappush(self._timers, timer)
+
+        def _cancel():
+            timer[2] = None
+
+        return _cancel
+
+    def next_timer(self):
+        """Échéance de la prochaine minuterie active (None s'il n'y en a pas)."""
+        while self._timers and self._timers[0][2] is None:
+            heapq.heappop(self._timers)
+        return self._timers[0][0] if self._timers else None
+
+    def fire_next(self):
+        due, _, action = heapq.heappop(self._timers)
+        self.t = max(self.t, due)
+        action()
+
+    def create_future(self):
+        return asyncio.get_running_loop().create_future()
+
+    async def wait_for(self, aw, timeout: float):
+        fut = asyncio.ensure_future(aw)
+        expired = False
+
+        def _expire():
+            nonlocal expired
+            if not fut.done():
+                expired = True
+                fut.cancel()
+
+        cancel = self.call_later(timeout, _expire)
+        try:
+            return await fut
+        except asyncio.CancelledError:
+            if expired:
+                raise asyncio.TimeoutError from None
+            raise
+        finally:
+            cancel()
+
+    async def call_service(self, domain: str, service: str, entity_id: str,
+                           data: dict | None = None):
+        engine = self.engine
+        if entity_id == engine.charger_entity:
+            key = "charger_limit"
+        else:
+            key = "set_level" if data else service
+        self.calls[key] = self.calls.get(key, 0) + 1
+        if entity_id == engine.charger_entity:
+            if engine.charger_sensor:
+                draw = data["value"] * engine.charger_unit_power
+                engine._update_cache(engine.charger_sensor, SimState(str(draw)))
+        elif data:
+            # Modulation : puissance retirée comptée par ReplayEngine.meter
+            self.levels[entity_id] = data
+        elif service == "turn_off":
+            self.off.add(entity_id)
+        else:
+            self.off.discard(entity_id)
+        engine._publish_device(entity_id)
+        await asyncio.sleep(0)
+
+
+class ReplayEngine(DelestageEngine):
+    """Moteur rejoué : décisions sérialisées, échantillon le plus récent gagnant."""
+
+    def __init__(self, backend: SimBackend, cfg: dict):
+        self._init_engine(backend)
+        self._configure(cfg)
+        backend.engine = self
+        self.last_power = None
+        self._pending = None
+        self._task = None
+        self.decisions = 0
+        self.decision_cpu = 0.0
+        # Charge simulée par équipement (puissance fixe, y compris en mode capteur)
+        self.loads = {eq.entity_id: eq.fixed_power for eq in self.table}
+        for eq in self.table:
+            self._publish_device(eq.entity_id)
+        if self.charger_sensor:
+            draw = self.charger_max_current * self.charger_unit_power
+            self._update_cache(self.charger_sensor, SimState(str(draw)))
+
+    def _publish_device(self, entity_id: str):
+        """Répercute l'état simulé d'un équipement dans le cache du moteur."""
+        eq = self._by_entity.get(entity_id)
+        if eq is None:
+            return
+        is_off = entity_id in self.backend.off
+        self._update_cache(entity_id, self._device_state(eq, is_off))
+        if eq.power_sensor:
+            load = 0.0 if is_off else self.loads[entity_id]
+            self._update_cache(eq.power_sensor, SimState(str(load)))
+
+    def _device_state(self, eq, is_off: bool) -> SimState:
+        """État simulé, avec le niveau réglé pour une charge modulable."""
+        if is_off:
+            return SimState("off")
+        data = self.backend.levels.get(eq.entity_id, {})
+        if eq.control == CONTROL_NUMBER:
+            return SimState(str(data.get("value", eq.max_level)))
+        if eq.control == CONTROL_BRIGHTNESS:
+            pct = data.get("brightness_pct", eq.max_level)
+            return SimState("on", {"brightness": round(pct * 255 / 100)})
+        if eq.control == CONTROL_CLIMATE:
+            return SimState("heat", {"temperature": data.get("temperature", SIM_SETPOINT)})
+        return SimState("on")
+
+    def meter(self, base: float) -> float:
+        """Puissance vue par le compteur : trace moins les charges coupées ou modulées."""
+        charger_cut = 0.0
+        if self.charger_entity and self._charger_limit is not None:
+            charger_cut = (
+                (self.charger_max_current - self._charger_limit) * self.charger_unit_power
+            )
+        return (
+            base
+            - sum(self.loads.get(e, 0.0) for e in self.backend.off)
+            - self.throttled_power()
+            - charger_cut
+        )
+
+    def feed(self, current_power: float):
+        self.last_power = current_power
+        self._observe_sample(current_power)
+        if self._deliver_sample(current_power):
+            return
+        if self.busy:
+            self._pending = current_power
+        else:
+            self._task = asyncio.ensure_future(self._run(current_power))
+
+    def _request_decision(self):
+        if self.last_power is not None:
+            self.feed(self.last_power)
+
+    def _discard_stale_samples(self):
+        self._pending = None
+
+    @property
+    def busy(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def blocked(self) -> bool:
+        """Décision en attente d'un échantillon ou d'une minuterie virtuelle."""
+        return bool(self._sample_waiters)
+
+    async def _run(self, current_power: float):
+        while True:
+            start = time.process_time()
+            began = self.backend.monotonic()
+            await self._delestage_logic(current_power)
+            self.decision_cpu += time.process_time() - start
+            self.decision_latency.record(self.backend.monotonic() - began)
+            self.decisions += 1
+            if self._pending is None:
+                return
+            current_power, self._pending = self._pending, None
+
+
+async def _settle(engine: ReplayEngine):
+    """Laisse tourner la boucle jusqu'à ce que le moteur soit inactif ou bloqué."""
+    for _ in range(10000):
+        await asyncio.sleep(0)
+        if not engine.busy or engine.blocked:
+            return
+
+
+async def _advance(backend: SimBackend, engine: ReplayEngine, until: float):
+    """Déclenche dans l'ordre les minuteries virtuelles échues avant ``until``."""
+    while True:
+        due = backend.next_timer()
+        if due is None or due > until:
+            break
+        backend.fire_next()
+        await _settle(engine)
+    backend.t = max(backend.t, until)
+
+
+async def replay(samples: list, cfg: dict, start: datetime, tz=None) -> dict:
+    """Rejoue ``samples`` (liste ``(secondes, puissance)``) et retourne le rapport."""
+    backend = SimBackend(start, tz)
+    engine = ReplayEngine(backend, cfg)
+
+    overshoot = 0.0
+    episodes = 0
+    prev_t = None
+    prev_over = False
+    peak = None
+
+    for t, base in samples:
+        await _advance(backend, engine, t)
+        if prev_over:
+            overshoot += t - prev_t
+        power = engine.meter(base)
+        over = power > engine.max_power
+        if over and not prev_over:
+            episodes += 1
+        prev_t, prev_over = t, over
+        peak = power if peak is None else max(peak, power)
+
+        engine.feed(power)
+        await _settle(engine)
+
+    # Fin de trace : les décisions bloquées se terminent sur leurs délais
+    while engine.busy and backend.next_timer() is not None:
+        backend.fire_next()
+        await _settle(engine)
+
+    calls = backend.calls
+    return {
+        "samples":         len(samples),
+        "duration_s":      round(samples[-1][0] - samples[0][0], 3) if samples else 0,
+        "max_power":       engine.max_power,
+        "peak_power":      peak,
+        "shed_count":      calls.get("turn_off", 0),
+        "recover_count":   calls.get("turn_on", 0),
+        "throttle_calls":  calls.get("set_level", 0),
+        "charger_calls":   calls.get("charger_limit", 0),
+        "charger_limit":   engine._charger_limit,
+        "actuator_calls":  sum(calls.values()),
+        "overshoot_s":     round(overshoot, 3),
+        "overshoot_events": episodes,
+        "decisions":       engine.decisions,
+        "decision_cpu_ms": round(engine.decision_cpu * 1000, 3),
+        "latency":         engine.latency_metrics(),
+        "prediction":      engine.prediction_metrics(),
+        "final_state":     engine.state,
+        "final_shed":      list(engine.devices_shed),
+        "shed_time_s":     {eq.entity_id: round(engine.shed_seconds(eq), 1) for eq in engine.table},
+    }
+
+
+# ──────────────────────────────────────────────────────────────
+# Lecture des traces
+# ──────────────────────────────────────────────────────────────
+
+def load_trace(path: str, entity_id: str | None = None):
+    """Lit une trace CSV ; retourne ``(début, [(secondes, puissance), …])``."""
+    with open(path, newline="", encoding="utf-8") as fh:
+        rows = list(csv.reader(fh))
+    if not rows:
+        return None, []
+
+    header = [c.strip().lower() for c in rows[0]]
+    if "state" in header and "last_changed" in header:
+        # Export d'historique Home Assistant
+        i_state = header.index("state")
+        i_time = header.index("last_changed")
+        i_entity = header.index("entity_id") if "entity_id" in header else None
+        points = []
+        for row in rows[1:]:
+            if entity_id and i_entity is not None and row[i_entity] != entity_id:
+                continue
+            point = _parse_point(row[i_time], row[i_state])
+            if point:
+                points.append(point)
+    else:
+        points = [p for p in (_parse_point(*row[:2]) for row in rows if len(row) >= 2) if p]
+
+    points.sort(key=lambda p: p[0])
+    if not points:
+        return None, []
+    start = points[0][0]
+    return start, [((ts - start).total_seconds(), power) for ts, power in points]
+
+
+def _parse_point(stamp: str, value: str):
+    try:
+        power = float(value)
+    except (TypeError, ValueError):
+        return None  # en-tête, unavailable, unknown…
+    stamp = stamp.strip()
+    try:
+        ts = datetime.fromtimestamp(float(stamp), timezone.utc)
+    except ValueError:
+        try:
+            ts = datetime.fromisoformat(stamp.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts, power
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rejeu hors ligne du délestage")
+    parser.add_argument("trace", help="CSV horodatage,puissance ou export d'historique")
+    parser.add_argument("--config", help="JSON data + options de l'entrée")
+    parser.add_argument("--entity", help="entity_id à garder dans un export d'historique")
+    parser.add_argument("--max-power", type=float)
+    parser.add_argument("--recovery-delay", type=float)
+    parser.add_argument("--rearm-margin", type=float)
+    parser.add_argument("--predict-horizon", type=float)
+    parser.add_argument("--tz", help="fuseau des plages horaires (ex. Europe/Paris)")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+
+    cfg = {}
+    if args.config:
+        with open(args.config, encoding="utf-8") as fh:
+            cfg = json.load(fh)
+    for key, value in (
+        (CONF_MAX_POWER, args.max_power),
+        (CONF_RECOVERY_DELAY, args.recovery_delay),
+        (CONF_REARM_MARGIN, args.rearm_margin),
+        (CONF_PREDICT_HORIZON, args.predict_horizon),
+    ):
+        if value is not None:
+            cfg[key] = value
+
+    tz = None
+    if args.tz:
+        try:
+            tz = ZoneInfo(args.tz)
+        except (ValueError, ZoneInfoNotFoundError):
+            parser.error(f"fuseau inconnu : {args.tz}")
+
+    start, samples = load_trace(args.trace, args.entity or cfg.get(CONF_POWER_SENSOR))
+    if not samples:
+        parser.error("aucun échantillon exploitable dans la trace")
+    report = asyncio.run(replay(samples, cfg, start, tz))
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
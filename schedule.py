@@ -0,0 +1,98 @@
+"""Seuils par plage horaire (HP/HC, Tempo), compilés en table par minute.
+
+Syntaxe : une règle par ligne (ou séparée par ``;``)::
+
+    06:00-22:00=6000
+    HC 22:00-06:00=9000
+    rouge 06:00-22:00=3000
+
+Le premier mot facultatif est l'état de l'entité tarif auquel la règle
+s'applique ; sans lui, la règle vaut pour tous les tarifs. Les règles d'un
+tarif priment sur les règles communes, et la dernière règle l'emporte en
+cas de chevauchement. Une plage qui passe minuit est admise, ``HH:MM-HH:MM``
+identiques couvrent la journée entière.
+"""
+import re
+
+MINUTES_PER_DAY = 1440
+# Profil des règles communes à tous les tarifs
+ANY_TARIFF = "*"
+
+_RULE = re.compile(
+    r"^(?:(?P<tariff>\S+)\s+)?"
+    r"(?P<start>\d{1,2}:\d{2})\s*-\s*(?P<end>\d{1,2}:\d{2})\s*=\s*(?P<watts>\d+(?:\.\d+)?)$"
+)
+
+
+class ThresholdSchedule:
+    """Seuil actif et prochaine bascule par tarif et minute du jour, en O(1)."""
+
+    __slots__ = ("_limits", "_next")
+
+    def __init__(self, rules: list):
+        self._limits = {}
+        self._next = {}
+        common = [r for r in rules if r[0] == ANY_TARIFF]
+        for tariff in {r[0] for r in rules} | {ANY_TARIFF}:
+            table = [None] * MINUTES_PER_DAY
+            layers = common if tariff == ANY_TARIFF else common + [
+                r for r in rules if r[0] == tariff
+            ]
+            for _, start, end, watts in layers:
+                span = (end - start) % MINUTES_PER_DAY or MINUTES_PER_DAY
+                for m in range(start, start + span):
+                    table[m % MINUTES_PER_DAY] = watts
+            self._limits[tariff] = table
+            self._next[tariff] = _next_changes(table)
+
+    def _profile(self, tariff):
+        return tariff if tariff in self._limits else ANY_TARIFF
+
+    def limit(self, tariff, minute: int):
+        """Seuil (W) à cette minute du jour ; None hors de toute plage."""
+        return self._limits[self._profile(tariff)][minute]
+
+    def next_change(self, tariff, minute: int):
+        """Minutes jusqu'à la prochaine bascule de seuil ; None si constant."""
+        return self._next[self._profile(tariff)][minute]
+
+
+def _next_changes(table: list) -> list:
+    """Distance à la prochaine valeur différente, en tournant sur minuit."""
+    if all(v == table[0] for v in table):
+        return [None] * MINUTES_PER_DAY
+    nxt = [0] * MINUTES_PER_DAY
+    # Deux tours à rebours : le second règle les plages qui passent minuit
+    dist = 0
+    for m in range(2 * MINUTES_PER_DAY - 1, -1, -1):
+        i = m % MINUTES_PER_DAY
+        if table[i] != table[(i + 1) % MINUTES_PER_DAY]:
+            dist = 1
+        else:
+            dist += 1
+        nxt[i] = dist
+    return nxt
+
+
+def parse_schedule(text: str):
+    """Compile le texte de planning ; None s'il est vide, ValueError si invalide."""
+    rules = []
+    for raw in re.split(r"[;\n]", text or ""):
+        line = raw.strip()
+        if not line:
+            continue
+        match = _RULE.match(line)
+        if not match:
+            raise ValueError(f"règle illisible : {line!r}")
+        tariff = (match["tariff"] or ANY_TARIFF).lower()
+        rules.append(
+            (tariff, _minute(match["start"]), _minute(match["end"]), float(match["watts"]))
+        )
+    return ThresholdSchedule(rules) if rules else None
+
+
+def _minute(text: str) -> int:
+    hours, minutes = (int(x) for x in text.split(":"))
+    if minutes > 59 or hours > 24 or (hours == 24 and minutes):
+        raise ValueError(f"heure invalide : {text}")
+    return (hours * 60 + minutes) % MINUTES_PER_DAY
@@ -13,6 +13,11 @@ from .entity import (
     DelestageCountSensor,
     DelestageShedPowerSensor,
     DelestageCountdownSensor,
+    DelestageReactionSensor,
+    DelestageOverloadDurationSensor,
+    DelestageDecisionTimeSensor,
+    DelestageServiceLatencySensor,
+    DelestagePredictionSensor,
 )
 
 _LOGGER = logging.getLogger(__name__)
@@ -25,7 +30,18 @@ async def async_setup_entry(
 ) -> None:
     """Créer et enregistrer tous les sensors."""
     coordinator = hass.data[DOMAIN][entry.entry_id]
+    entities = build_entities(coordinator, entry)
 
+    # Pas de update_before_add : les données initiales sont déjà calculées
+    async_add_entities(entities)
+    _LOGGER.info(
+        "Délestage : %d entité(s) créée(s) (dont %d équipement(s))",
+        len(entities), len(coordinator.equipments)
+    )
+
+
+def build_entities(coordinator, entry) -> list:
+    """Entités de l'intégration pour un coordinateur (plateforme et banc d'essai)."""
     entities = [
         # Sensor principal (état + tous les attributs)
         DelestageSensor(coordinator, entry),
@@ -35,14 +51,15 @@ async def async_setup_entry(
         DelestageCountSensor(coordinator, entry),
         DelestageShedPowerSensor(coordinator, entry),
         DelestageCountdownSensor(coordinator, entry),
+        # Diagnostic : latences de réaction
+        DelestageReactionSensor(coordinator, entry),
+        DelestageOverloadDurationSensor(coordinator, entry),
+        DelestageDecisionTimeSensor(coordinator, entry),
+        DelestageServiceLatencySensor(coordinator, entry),
+        DelestagePredictionSensor(coordinator, entry),
     ]
 
     # Un sensor par équipement configuré
-    for eq in coordinator.equipments:
+    for eq in coordinator.table:
         entities.append(DelestageEquipmentSensor(coordinator, entry, eq))
-
-    async_add_entities(entities, True)
-    _LOGGER.info(
-        "Délestage : %d entité(s) créée(s) (dont %d équipement(s))",
-        len(entities), len(coordinator.equipments)
-    )
+    return entities